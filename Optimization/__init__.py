@@ -1,8 +1,11 @@
+from .load_points_parquet import load_grouped_points # load grouped points stored as GeoParquet (memory-mapped)
 from .analysis_vehicles_stats import prepare_vehicles_with_stats # first make stats for vehicles
+from .coverage_matrix import CoverageMatrix # shared vehicle x CBS-cell incidence (optional input for the optimizers)
 from .optimization_vehicles_spatial import spatial_optimization_pipeline # then optimize the vehicles for spatial coverage
 from .optimization_vehicles_temporal import temporal_optimization_pipeline # then optimize the vehicles for temporal coverage
 from .optimization_vehicles_fairness import run_fairness_pipeline # then optimize the vehicles for fairness
 from .optimization_vehicles_maximum import run_max_coverage_pipeline # then optimize the vehicles for maximum inhabitants, points, etc. 
+from .optimization_vehicles_pareto import pareto_optimization_pipeline # optionally search the Pareto front of cells, inhabitants, points and fairness
 from .create_combined_df import combine_optimized_dfs # combine the results into one dataframe
 from .optimization_vehicles_combined import compute_combined_optimization_scores # compute the final scores combined vehicles optimization 
 from .optimization_big_merge_stats_VIZ_points import select_random_vehicles # select random vehicles for optmization 
@@ -1,26 +1,62 @@
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import mapclassify
 import plotly.express as px
 from shapely.geometry import MultiPoint
-import ast
+from .coverage_matrix import CoverageMatrix, parse_cell_list
+from Preparation.cbs_cell_codec import encode_cell_ids, decode_cell_ids
+
+
+def vehicle_cell_lists(points_df):
+    """
+    Unique 'E####N####' cell ids per uni_id from a native list column of 'crs28992_list'
+    (int64 codes from GeoParquet, or lists of ids), using one flat array of (vehicle, cell) codes.
+
+    Returns:
+    - pd.Series indexed by uni_id with lists of cell ids
+    """
+    cell_lists = [c if isinstance(c, np.ndarray) else parse_cell_list(c) for c in points_df['crs28992_list']]
+    lengths = np.array([len(c) for c in cell_lists], dtype=np.int64)
+    codes = encode_cell_ids(pd.Series(np.concatenate(cell_lists) if len(cell_lists) else []))
+    vehicle_codes, vehicle_ids = pd.factorize(points_df['uni_id'])
+    vehicles = np.repeat(vehicle_codes, lengths)
+
+    # unique (vehicle, cell) pairs, sorted by vehicle
+    keep = (codes >= 0) & (vehicles >= 0)
+    pairs = np.unique((vehicles[keep].astype(np.int64) << 32) | codes[keep])
+    vehicles, labels = pairs >> 32, decode_cell_ids(pairs & 0xFFFFFFFF)
+    starts = np.flatnonzero(np.r_[True, vehicles[1:] != vehicles[:-1]])
+    bounds = np.r_[starts, len(pairs)]
+    return pd.Series(
+        [labels[a:b].tolist() for a, b in zip(bounds[:-1], bounds[1:])],
+        index=vehicle_ids[vehicles[starts]], dtype=object
+    )
 
 
 def create_vehicles_gdf(points_df):
     """
     Aggregate points_df by uni_id into vehicles_1503 GeoDataFrame.
+    'crs28992_list' may hold stringified lists (GPKG) or native lists / int64 code arrays
+    (GeoParquet, see load_grouped_points); 'crs28922_list' always holds cell id strings.
     """
+    if isinstance(points_df["uni_id"].dtype, pd.CategoricalDtype):
+        points_df = points_df.assign(uni_id=points_df["uni_id"].astype(object))
+    native_lists = len(points_df) > 0 and not isinstance(points_df["crs28992_list"].iloc[0], str)
 
     # 1. stats aggregation
-    stats = points_df.groupby("uni_id").agg(
-        route_id=("route_id_left", lambda x: list(set(x))),
-        crs28992_list=("crs28992_list", lambda x: list(set(x))),
-        min_new_timest=("new_timest", "min"),
-        max_new_timest=("new_timest", "max"),
-        count=("id", "count")
-    ).reset_index()
+    aggregations = {
+        "route_id": ("route_id_left", lambda x: list(set(x))),
+        "crs28992_list": ("crs28992_list", lambda x: list(set(x))),
+        "min_new_timest": ("new_timest", "min"),
+        "max_new_timest": ("new_timest", "max"),
+        "count": ("id", "count"),
+    }
+    if native_lists:
+        del aggregations["crs28992_list"]  # lists are not hashable, combined in step 4
+    stats = points_df.groupby("uni_id").agg(**aggregations).reset_index()
 
     # 2. build MultiPoint geometry
     geom = points_df.groupby("uni_id")["geometry"] \
@@ -31,16 +67,19 @@ def create_vehicles_gdf(points_df):
     df = stats.merge(geom, on="uni_id")
 
     # 4. flatten crs28922_list per row
-    df["crs28922_list"] = df["crs28992_list"].apply(
-        lambda rows: list(dict.fromkeys(
-            item
-            for row in rows
-            for item in ast.literal_eval(row)
-        ))
-    )
+    if native_lists:
+        df["crs28922_list"] = df["uni_id"].map(vehicle_cell_lists(points_df)).apply(parse_cell_list)
+    else:
+        df["crs28922_list"] = df["crs28992_list"].apply(
+            lambda rows: list(dict.fromkeys(
+                item
+                for row in rows
+                for item in parse_cell_list(row)
+            ))
+        )
 
     # 5. delete crs28992_list and rename correctly
-    df.drop(columns=["crs28992_list"], inplace=True)
+    df.drop(columns=["crs28992_list"], inplace=True, errors="ignore")
     df.rename(columns={"crs28922_list": "crs28922_list"}, inplace=True)
 
     # 6. count unique values in crs28922_list
@@ -87,20 +126,24 @@ def enrich_vehicles_with_cbs_and_routes(vehicles_gdf, points_gdf, cbs_gdf):
     sum_cols = ['A_inhab', 'A_0_15', 'A_15_25', 'A_25_45', 'A_45_65', 'A_65+', 'A_nederlan', 'A_west_mig', 'A_n_west_m']
     mean_col = 'G_woz_woni'
 
-    # Explode CRS list to individual rows
-    exploded = vehicles_gdf[['uni_id', 'crs28922_list']].explode('crs28922_list').rename(columns={'crs28922_list': 'crs28992'})
+    # Explode CRS list to individual rows, join on integer cell codes (-1 = missing/invalid id, never joined)
+    exploded = vehicles_gdf[['uni_id', 'crs28922_list']].explode('crs28922_list')
+    exploded['cell'] = encode_cell_ids(exploded['crs28922_list'])
+
+    cbs_values = pd.DataFrame(cbs_gdf[sum_cols + [mean_col]])
+    cbs_values['cell'] = encode_cell_ids(cbs_gdf['crs28992'])
 
     # Merge CBS data
-    merged = exploded.merge(
-        cbs_gdf[['crs28992'] + sum_cols + [mean_col]],
-        on='crs28992',
-        how='left'
+    merged = exploded.loc[exploded['cell'] >= 0, ['uni_id', 'cell']].merge(
+        cbs_values[cbs_values['cell'] >= 0], on='cell', how='left'
     )
 
-    # Aggregate CBS stats per vehicle
+    # Aggregate CBS stats per vehicle; vehicles without valid cells get zero sums
     agg_map = {col: 'sum' for col in sum_cols}
     agg_map[mean_col] = 'mean'
-    agg = merged.groupby('uni_id').agg(agg_map).reset_index()
+    agg = merged.groupby('uni_id').agg(agg_map).reindex(exploded['uni_id'].unique())
+    agg[sum_cols] = agg[sum_cols].fillna(0)
+    agg = agg.rename_axis('uni_id').reset_index()
 
     # Merge aggregated CBS stats
     vehicles_gdf = vehicles_gdf.merge(agg, on='uni_id', how='left')
@@ -126,19 +169,27 @@ def enrich_vehicles_with_cbs_and_routes(vehicles_gdf, points_gdf, cbs_gdf):
 
 # FINAL FUNCTION
 
-def prepare_vehicles_with_stats(points_grouped, cbs_full):
+def prepare_vehicles_with_stats(points_grouped, cbs_full, return_coverage=False):
     """
     Full pipeline:
     1. Creates vehicle-level GeoDataFrame from grouped points.
     2. Enriches with CBS statistics and route types.
+    3. Optionally builds the shared vehicle x CBS-cell CoverageMatrix.
 
     Parameters:
-    - points_grouped : GeoDataFrame grouped by 'uni_id' with 'route_type' and other data.
-    - cbs_full       : CBS GeoDataFrame with 'crs28992' and demographic data.
+    - points_grouped  : GeoDataFrame grouped by 'uni_id' with 'route_type' and other data.
+    - cbs_full        : CBS GeoDataFrame with 'crs28992' and demographic data.
+    - return_coverage : if True, also return the CoverageMatrix of 'crs28922_list'.
 
     Returns:
     - vehicles_stats : GeoDataFrame enriched with CBS data and route_type.
+    - coverage       : CoverageMatrix (only if return_coverage=True), rows in vehicles_stats order.
     """
     vehicles_gdf = create_vehicles_gdf(points_grouped)
     vehicles_stats = enrich_vehicles_with_cbs_and_routes(vehicles_gdf, points_grouped, cbs_full)
+
+    if return_coverage:
+        coverage = CoverageMatrix.from_vehicles(vehicles_stats)
+        return vehicles_stats, coverage
+
     return vehicles_stats
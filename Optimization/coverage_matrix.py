@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from Preparation.cbs_cell_codec import encode_cell_ids, decode_cell_ids, parse_cell_list
+
+
+class CoverageMatrix:
+    """
+    Sparse vehicle x CBS-cell incidence: matrix[v, c] = 1 when vehicle v senses cell c.
+
+    Rows follow vehicle_ids, columns follow cell_ids (int64 codes from encode_cell_ids;
+    decode_cell_ids turns them back into 'E####N####' strings for export). The matrix is a
+    scipy CSR, so the cells of one vehicle are matrix.indices[matrix.indptr[v]:matrix.indptr[v + 1]].
+    Build it once (e.g. prepare_vehicles_with_stats(..., return_coverage=True)) and pass it
+    to the optimizers and summary functions instead of re-parsing the string lists.
+    """
+
+    def __init__(self, matrix, vehicle_ids, cell_ids):
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.int32)
+        self.matrix.sum_duplicates()
+        self.matrix.data[:] = 1
+        self.vehicle_ids = pd.Index(vehicle_ids)
+        self.cell_ids = pd.Index(cell_ids)
+        self._vehicle_str = self.vehicle_ids.astype(str)
+
+    @classmethod
+    def from_pairs(cls, vehicles, cells, vehicle_ids=None):
+        """
+        Builds the matrix from parallel (vehicle, cell) arrays, e.g. points 'uni_id' and 'id'.
+        Pairs with a missing cell are ignored; vehicles without cells keep an empty row.
+
+        Parameters:
+        - vehicles    : array-like of vehicle IDs
+        - cells       : array-like of CBS cell ids (strings or integer codes)
+        - vehicle_ids : optional row order; defaults to the sorted unique vehicles
+        """
+        vehicles = pd.Series(np.asarray(vehicles, dtype=object))
+        codes = encode_cell_ids(pd.Series(np.asarray(cells, dtype=object)))
+
+        if vehicle_ids is None:
+            _, vehicle_ids = pd.factorize(vehicles, sort=True)
+        vehicle_ids = pd.Index(vehicle_ids)
+
+        keep = codes >= 0
+        rows = vehicle_ids.get_indexer(vehicles[keep])
+        cell_codes, cell_ids = pd.factorize(codes[keep])
+
+        valid = rows >= 0
+        matrix = sparse.csr_matrix(
+            (np.ones(valid.sum(), dtype=np.int32), (rows[valid], cell_codes[valid])),
+            shape=(len(vehicle_ids), len(cell_ids))
+        )
+        return cls(matrix, vehicle_ids, cell_ids)
+
+    @classmethod
+    def from_vehicles(cls, vehicles_gdf, id_col='uni_id', list_col='crs28922_list'):
+        """
+        Builds the matrix from a vehicles GeoDataFrame, one row per vehicle in frame order.
+        """
+        cell_lists = vehicles_gdf[list_col].apply(parse_cell_list)
+        lengths = cell_lists.str.len().to_numpy()
+        vehicles = np.repeat(vehicles_gdf[id_col].to_numpy(), lengths)
+        cells = [c for cells in cell_lists for c in cells]
+        return cls.from_pairs(vehicles, cells, vehicle_ids=pd.unique(vehicles_gdf[id_col]))
+
+    @property
+    def n_vehicles(self):
+        return self.matrix.shape[0]
+
+    @property
+    def n_cells(self):
+        return self.matrix.shape[1]
+
+    @property
+    def sizes(self):
+        """Number of distinct cells per vehicle (row order)."""
+        return np.diff(self.matrix.indptr)
+
+    def row_cells(self, row):
+        """Column positions of the cells sensed by the vehicle in row `row`."""
+        return self.matrix.indices[self.matrix.indptr[row]:self.matrix.indptr[row + 1]]
+
+    def rows(self, ids):
+        """
+        Row positions of the given vehicle IDs (compared as strings, like the lists_dict values).
+        IDs that are not in the matrix are ignored.
+        """
+        ids = pd.Index(ids).astype(str)
+        return np.flatnonzero(self._vehicle_str.isin(ids))
+
+    def aligned(self, ids):
+        """
+        Incidence rows in the order of the given vehicle IDs (e.g. a vehicles frame),
+        as a CSR matrix; IDs that are not in the matrix get an empty row.
+        """
+        rows = self.vehicle_ids.get_indexer(ids)
+        known = rows >= 0
+        matrix = self.matrix[rows[known]]
+
+        # known rows keep their cells in order, unknown rows get none
+        lengths = np.zeros(len(rows), dtype=np.int64)
+        lengths[known] = np.diff(matrix.indptr)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(len(rows), self.n_cells))
+
+    def union_mask(self, rows):
+        """Boolean mask over cells covered by at least one of the given rows."""
+        mask = np.zeros(self.n_cells, dtype=bool)
+        mask[self.matrix[np.asarray(rows, dtype=np.int64)].indices] = True
+        return mask
+
+    def cells(self, ids=None, as_str=False):
+        """
+        Unique cell codes covered by the given vehicle IDs (all vehicles if None).
+        as_str=True returns 'E####N####' ids instead, for export.
+        """
+        rows = np.arange(self.n_vehicles) if ids is None else self.rows(ids)
+        codes = self.cell_ids[self.union_mask(rows)].to_numpy()
+        return decode_cell_ids(codes) if as_str else codes
+
+    def cbs_columns(self, cbs_gdf, code_col='crs28992'):
+        """
+        Column position of every CBS row's cell in this matrix (-1 if no vehicle senses it).
+        Compute it once per CBS frame and reuse it with covered_cbs_rows.
+        """
+        return self.cell_ids.get_indexer(encode_cell_ids(cbs_gdf[code_col]))
+
+    def covered_cbs_rows(self, rows, cbs_cols):
+        """Boolean mask over CBS rows sensed by the union of the given vehicle rows."""
+        mask = self.union_mask(rows)
+        return (cbs_cols >= 0) & mask[np.maximum(cbs_cols, 0)]
@@ -0,0 +1,26 @@
+import geopandas as gpd
+from Preparation.cbs_cell_codec import decode_cell_lists
+
+
+def load_grouped_points(path, columns=None, decode_cells=False):
+    """
+    Loads grouped_by_points written by write_grouped_points_parquet (GeoParquet), memory-mapped.
+
+    'crs28992_list' stays a native column of int64 cell code arrays, which prepare_vehicles_with_stats
+    (create_vehicles_gdf) and CoverageMatrix read directly; text ID columns ('uni_id', 'trip_id',
+    'interval') come back as categoricals and the geometry from WKB.
+
+    Parameters:
+    - path         : .parquet file (e.g. data/temp/grouped_by_points_GVB.parquet)
+    - columns      : optional list of columns to read (geometry is always included)
+    - decode_cells : if True, 'crs28992_list' holds lists of 'E####N####' ids instead of codes
+
+    Returns:
+    - GeoDataFrame of grouped points (EPSG:28992)
+    """
+    if columns is not None and 'geometry' not in columns:
+        columns = list(columns) + ['geometry']
+    points = gpd.read_parquet(path, columns=columns, memory_map=True)
+    if decode_cells and 'crs28992_list' in points:
+        points['crs28992_list'] = decode_cell_lists(points['crs28992_list']).map(list)
+    return points
@@ -2,10 +2,11 @@ import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.spatial.distance import euclidean
 import numpy as np
 import math
 import ast
+from scipy import sparse
+from .coverage_matrix import CoverageMatrix, parse_cell_list
 
 
 def calculate_percentages_from_vehicles(gdf_vehicles):
@@ -60,28 +61,118 @@ def extract_string_lists(df, prefixes=None):
     }
 
 
+### SUMMARY ENGINE - strategy x vehicle membership
+def strategy_membership(vehicle_ids, lists_dict):
+    """
+    Sparse strategy x vehicle membership: M[s, v] = 1 when vehicle row v is in the list of strategy s.
+    IDs are compared as strings (like `id_col.astype(str).isin(ids)`), duplicates count once.
+    Every per-strategy sum, count or union is then one sparse product with M.
+
+    Parameters:
+        vehicle_ids : array-like of vehicle IDs, one per vehicle row (e.g. gdf['uni_id'])
+        lists_dict  : dict {label: list of uni_id strings}
+
+    Returns:
+        CSR matrix (len(lists_dict) x len(vehicle_ids)), rows in lists_dict order
+    """
+    vehicle_str = pd.Series(np.asarray(vehicle_ids, dtype=object)).astype(str)
+    lengths = [len(ids) for ids in lists_dict.values()]
+    flat = pd.Series([vid for ids in lists_dict.values() for vid in ids], dtype=object).astype(str)
+    id_codes, unique_ids = pd.factorize(flat)
+
+    # strategy x listed-ID, then listed-ID x vehicle row
+    strategy_ids = sparse.csr_matrix(
+        (np.ones(len(flat)), (np.repeat(np.arange(len(lengths)), lengths), id_codes)),
+        shape=(len(lengths), len(unique_ids))
+    )
+    vehicle_codes = pd.Index(unique_ids).get_indexer(vehicle_str)
+    listed = np.flatnonzero(vehicle_codes >= 0)
+    id_vehicles = sparse.csr_matrix(
+        (np.ones(len(listed)), (vehicle_codes[listed], listed)),
+        shape=(len(unique_ids), len(vehicle_str))
+    )
+    membership = (strategy_ids @ id_vehicles).tocsr()
+    membership.data[:] = 1
+    return membership
+
+
+def strategy_cells(coverage, lists_dict):
+    """
+    0/1 sparse strategy x cell matrix: cells sensed by the union of each strategy's vehicles.
+    """
+    covered = (strategy_membership(coverage.vehicle_ids, lists_dict) @ coverage.matrix).tocsr()
+    covered.data[:] = 1
+    return covered
+
+
+def cell_values(coverage, cbs_gdf, cols, cbs_crs_col='crs28992'):
+    """
+    (n_cells x len(cols)) sums of the CBS columns per coverage column; cells missing from
+    the CBS grid are 0, missing values count as 0.
+    """
+    cbs_cols = coverage.cbs_columns(cbs_gdf, cbs_crs_col)
+    known = cbs_cols >= 0
+    values = np.zeros((coverage.n_cells, len(cols)))
+    np.add.at(values, cbs_cols[known], np.nan_to_num(cbs_gdf.loc[known, cols].to_numpy(dtype=float)))
+    return values
+
+
+def strategy_sums(membership, values):
+    """Per-strategy sums of vehicle values (NaN counts as 0); values is (n_vehicles,) or (n_vehicles x k)."""
+    return membership @ np.nan_to_num(np.asarray(values, dtype=float))
+
+
+def strategy_means(membership, values):
+    """Per-strategy means of vehicle values, skipping NaN (NaN for strategies without values)."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return strategy_sums(membership, values) / (membership @ (~np.isnan(values)).astype(float))
+
+
+def parse_route_list(val):
+    """Route IDs of one 'route_id' entry: lists, stringified lists or comma-separated strings."""
+    if isinstance(val, list):
+        return val
+    try:
+        lst = ast.literal_eval(val)
+        if isinstance(lst, list):
+            return lst
+    except:
+        pass
+    return [v.strip() for v in str(val).strip("[]").split(",") if v.strip()]
+
+
+def route_incidence(vehicles_gdf, route_col='route_id'):
+    """Sparse vehicle x route matrix of the routes each vehicle row ran on."""
+    routes = vehicles_gdf[route_col].map(parse_route_list)
+    lengths = routes.str.len().to_numpy()
+    route_codes, unique_routes = pd.factorize(pd.Series([r for lst in routes for r in lst], dtype=object))
+    return sparse.csr_matrix(
+        (np.ones(len(route_codes)), (np.repeat(np.arange(len(routes)), lengths), route_codes)),
+        shape=(len(routes), len(unique_routes))
+    )
+
+
 ### FUNCTION 2 - compute sums (connect to vehicles)
 def compute_and_export_sums(
     gdf,
     lists_dict,
     id_col='uni_id',
     value_cols=['A_inhab', 'A_0_15', 'A_65+', 'A_nederlan','A_n_west_m','count'],
+    membership=None
 ):
     """
     Filters gdf by each list in lists_dict, sums only value_cols,
     builds a summary DataFrame (rows=value_cols, cols=groups),
     exports it to CSV, and returns the DataFrame.
+    membership: optional strategy_membership(gdf[id_col], lists_dict), shared by the summary steps.
     """
     # compute sums
-    results = {
-        label: {
-            col: gdf[gdf[id_col].astype(str).isin(ids)][col].sum()
-            for col in value_cols
-        }
-        for label, ids in lists_dict.items()
-    }
+    if membership is None:
+        membership = strategy_membership(gdf[id_col], lists_dict)
+    sums = strategy_sums(membership, gdf[value_cols].to_numpy(dtype=float))
     # build summary DataFrame
-    df_summary = pd.DataFrame(results, index=value_cols).astype(int)
+    df_summary = pd.DataFrame(sums.T, index=value_cols, columns=list(lists_dict)).astype(int)
    
     return df_summary
 
@@ -92,58 +183,9 @@ def extract_unique_crs_codes(vehicles_gdf, column='crs28922_list'):
     """
     unique_cells = set()
     for val in vehicles_gdf[column]:
-        if isinstance(val, list):
-            unique_cells.update(val)
-        else:
-            inner = val.strip("[]")
-            parts = inner.split("', '")
-            parts = [p.strip(" '\"") for p in parts if p.strip(" '\"")]
-            unique_cells.update(parts)
+        unique_cells.update(parse_cell_list(val))
     return list(unique_cells)
 
-def compute_cbs_summaries(
-    vehicles_gdf,
-    cbs_gdf,
-    lists_dict,
-    id_col='uni_id',
-    vehicle_crs_col='crs28922_list',
-    cbs_crs_col='crs28992',
-    sum_cols=['A_inhab','A_0_15','A_65+','A_nederlan','A_n_west_m'],
-    export_path=None
-):
-    """
-    For each key in lists_dict:
-      1. Filter vehicles_gdf by matching IDs.
-      2. Extract unique CRS codes from vehicle_crs_col.
-      3. Filter cbs_gdf by those codes.
-      4. Sum the sum_cols in that filtered CBS.
-    Builds a summary DataFrame (rows=sum_cols_uniq plus cells_unique, cols=list keys),
-    optionally exports it, and returns it.
-    """
-    results = {}
-    codes_counts = {}
-    for label, vid_list in lists_dict.items():
-        # subset vehicles
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(vid_list)]
-        # extract unique CRS codes and count them
-        codes = extract_unique_crs_codes(subset, column=vehicle_crs_col)
-        codes_counts[label] = len(codes)
-        # filter CBS and sum desired columns
-        cb = cbs_gdf[cbs_gdf[cbs_crs_col].isin(codes)]
-        results[label] = {col: int(cb[col].sum()) for col in sum_cols}
-
-    # build summary DataFrame
-    df_summary = pd.DataFrame(results, index=sum_cols).astype(int)
-    df_summary.index = [f"{idx}_uniq" for idx in df_summary.index]
-
-    # add row counting unique cells
-    df_summary.loc['cells_unique'] = pd.Series(codes_counts, dtype=int)
-
-    if export_path:
-        df_summary.to_csv(export_path)
-
-    return df_summary
-
 def compute_cbs_summaries(
     vehicles_gdf,
     cbs_gdf,
@@ -152,43 +194,25 @@ def compute_cbs_summaries(
     vehicle_crs_col='crs28922_list',
     cbs_crs_col='crs28992',
     sum_cols=['A_inhab', 'A_0_15', 'A_65+', 'A_nederlan', 'A_n_west_m'],
-    export_path=None
+    export_path=None,
+    coverage=None
 ):
     """
-    For each key in lists_dict:
-      1. Filter vehicles_gdf by matching IDs.
-      2. Extract unique CRS codes from vehicle_crs_col.
-      3. Filter cbs_gdf by those codes.
-      4. Sum the sum_cols in that filtered CBS.
+    For each key in lists_dict, sums the sum_cols over the CBS cells sensed by the union of
+    its vehicles (strategy x cell union @ per-cell values, all strategies at once).
     Builds a summary DataFrame (rows=sum_cols_uniq plus cells_unique, cols=list keys),
     optionally exports it, and returns it.
+
+    The vehicle → cell lists come from `coverage`; if None it is built once from vehicle_crs_col.
     """
-    results = {}
-    codes_counts = {}
-
-    for label, vid_list in lists_dict.items():
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(vid_list)]
-
-        # --- Inline extract_unique_crs_codes ---
-        unique_cells = set()
-        for val in subset[vehicle_crs_col]:
-            if isinstance(val, list):
-                unique_cells.update(val)
-            else:
-                inner = val.strip("[]")
-                parts = inner.split("', '")
-                parts = [p.strip(" '\"") for p in parts if p.strip(" '\"")]
-                unique_cells.update(parts)
-        codes = list(unique_cells)
-        # ----------------------------------------
-
-        codes_counts[label] = len(codes)
-        cb = cbs_gdf[cbs_gdf[cbs_crs_col].isin(codes)]
-        results[label] = {col: int(cb[col].sum()) for col in sum_cols}
-
-    df_summary = pd.DataFrame(results, index=sum_cols).astype(int)
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(vehicles_gdf, id_col=id_col, list_col=vehicle_crs_col)
+    covered = strategy_cells(coverage, lists_dict)
+    sums = covered @ cell_values(coverage, cbs_gdf, sum_cols, cbs_crs_col)
+
+    df_summary = pd.DataFrame(sums.T, index=sum_cols, columns=list(lists_dict)).astype(int)
     df_summary.index = [f"{idx}_uniq" for idx in df_summary.index]
-    df_summary.loc['cells_unique'] = pd.Series(codes_counts, dtype=int)
+    df_summary.loc['cells_unique'] = pd.Series(np.asarray(covered.sum(axis=1)).ravel(), index=list(lists_dict), dtype=int)
 
     if export_path:
         df_summary.to_csv(export_path)
@@ -201,7 +225,8 @@ def compute_and_merge_summaries(
     gdf,
     lists_dict,
     id_col='uni_id',
-    woz_col='G_woz_woni'
+    woz_col='G_woz_woni',
+    membership=None
 ):
     """
     Merges summaries from spatial/pop/fair/etc groups,
@@ -209,10 +234,9 @@ def compute_and_merge_summaries(
     """
 
     # Compute G_woz_woni means as summary_df3
-    summary_df3 = pd.DataFrame([{
-        label: gdf[gdf[id_col].astype(str).isin(ids)][woz_col].mean()
-        for label, ids in lists_dict.items()
-    }], index=[woz_col])
+    if membership is None:
+        membership = strategy_membership(gdf[id_col], lists_dict)
+    summary_df3 = pd.DataFrame([strategy_means(membership, gdf[woz_col])], index=[woz_col], columns=list(lists_dict))
 
     # Merge all summaries
     merged_df = pd.concat([summary_df1, summary_df2, summary_df3], axis=0)
@@ -246,16 +270,14 @@ def add_euclidean_distances(merged_df, ams_stats):
     ]
 
     target = np.array([float(ams[p]) for _, p in metrics])
-    dist_vals = {}
-
-    for col in merged_df.columns:
-        vec = [float(merged_df.loc[m, col]) for m, _ in metrics]
-        dist_vals[col] = round(euclidean(target, vec), 2)
+    values = merged_df.loc[[m for m, _ in metrics]].astype(float).to_numpy()
+    distances = np.sqrt(((values - target[:, None]) ** 2).sum(axis=0)).round(2)
+    dist_vals = dict(zip(merged_df.columns, distances))
 
     return pd.concat([merged_df, pd.DataFrame(dist_vals, index=['euclidean_distance'])])
 
 def add_bus_tram_counts(vehicles_gdf, lists_dict, summary_df,
-                   id_col='uni_id', route_type_col='route_type_left'):
+                   id_col='uni_id', route_type_col='route_type_left', membership=None):
     """
     Adds a row 'buses_count' to summary_df, counting how many selected vehicles
     in each group are buses (route_type == 3).
@@ -266,24 +288,19 @@ def add_bus_tram_counts(vehicles_gdf, lists_dict, summary_df,
         summary_df     : DataFrame with groups as columns
         id_col         : column name for vehicle ID (default 'uni_id')
         route_type_col : column name for route type (default 'route_type')
+        membership     : optional strategy_membership(vehicles_gdf[id_col], lists_dict)
 
     Returns:
         summary_df with an extra row 'buses_count'
     """
-    
-    bus_counts = {}
-    for label, ids in lists_dict.items():
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(ids)]
-        bus_counts[label] = int((subset[route_type_col] == 3).sum())
-
-    tram_counts = {}
-    for label, ids in lists_dict.items():
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(ids)]
-        tram_counts[label] = int((subset[route_type_col] == 0).sum())
+    if membership is None:
+        membership = strategy_membership(vehicles_gdf[id_col], lists_dict)
+    route_type = vehicles_gdf[route_type_col].to_numpy()
+    counts = strategy_sums(membership, np.column_stack([route_type == 3, route_type == 0]))
 
     # append the counts as a new row
-    summary_df.loc['buses_count'] = pd.Series(bus_counts, dtype=int)
-    summary_df.loc['trams_count'] = pd.Series(tram_counts, dtype=int)
+    summary_df.loc['buses_count'] = pd.Series(counts[:, 0], index=list(lists_dict), dtype=int)
+    summary_df.loc['trams_count'] = pd.Series(counts[:, 1], index=list(lists_dict), dtype=int)
     return summary_df
 
 
@@ -293,7 +310,8 @@ def add_unique_route_counts(
     lists_dict,
     summary_df,
     id_col='uni_id',
-    route_col='route_id'
+    route_col='route_id',
+    membership=None
 ):
     """
     Appends a row 'routes_unique' to summary_df, counting the number of distinct
@@ -305,31 +323,16 @@ def add_unique_route_counts(
         summary_df   : DataFrame with groups as columns
         id_col       : column name for vehicle ID (default 'uni_id')
         route_col    : column name for route list (default 'route_id')
+        membership   : optional strategy_membership(vehicles_gdf[id_col], lists_dict)
 
     Returns:
         summary_df with an extra row 'routes_unique'
     """
-    route_counts = {}
-    for label, ids in lists_dict.items():
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(ids)]
-        uniq_routes = set()
-        for val in subset[route_col]:
-            if isinstance(val, list):
-                uniq_routes.update(val)
-            else:
-                # parse stringified list
-                try:
-                    lst = ast.literal_eval(val)
-                    if isinstance(lst, list):
-                        uniq_routes.update(lst)
-                        continue
-                except:
-                    pass
-                # fallback: split on commas
-                uniq_routes.update([v.strip() for v in str(val).strip("[]").split(",") if v.strip()])
-        route_counts[label] = len(uniq_routes)
-
-    summary_df.loc['routes_unique'] = pd.Series(route_counts, dtype=int)
+    if membership is None:
+        membership = strategy_membership(vehicles_gdf[id_col], lists_dict)
+    routes = (membership @ route_incidence(vehicles_gdf, route_col)).tocsr()
+
+    summary_df.loc['routes_unique'] = pd.Series(np.diff(routes.indptr), index=list(lists_dict), dtype=int)
     return summary_df
 
 
@@ -412,7 +415,9 @@ def add_cells_unique_counts(
     lists_dict,
     id_col='uni_id',
     crs_col='crs28922_list',
-    count_col='count'
+    count_col='count',
+    coverage=None,
+    membership=None
 ):
     """
     Adds 'cells_unique' and 'avg_points_per_cell' rows to summary_df.
@@ -424,26 +429,31 @@ def add_cells_unique_counts(
         id_col       : column with vehicle ID
         crs_col      : column with list of CRS codes
         count_col    : column with total measurement count
+        coverage     : optional CoverageMatrix; built from crs_col if None
+        membership   : optional strategy_membership(vehicles_gdf[id_col], lists_dict)
 
     Returns:
         summary_df with new rows added.
     """
-    counts = {}
-    avg_per_cell = {}
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(vehicles_gdf, id_col=id_col, list_col=crs_col)
+    if membership is None:
+        membership = strategy_membership(vehicles_gdf[id_col], lists_dict)
 
     # Strategy-specific counts and ratios
-    for label, vid_list in lists_dict.items():
-        subset = vehicles_gdf[vehicles_gdf[id_col].astype(str).isin(vid_list)]
-        crs_codes = extract_unique_crs_codes(subset, column=crs_col)
-        counts[label] = len(crs_codes)
-        total_count = subset[count_col].sum()
-        avg_per_cell[label] = round(total_count / len(crs_codes), 2) if len(crs_codes) > 0 else 0
+    n_cells = np.asarray(strategy_cells(coverage, lists_dict).sum(axis=1)).ravel()
+    total_counts = strategy_sums(membership, vehicles_gdf[count_col])
+    counts = dict(zip(lists_dict, n_cells.tolist()))
+    avg_per_cell = {
+        label: round(total / cells, 2) if cells > 0 else 0
+        for label, total, cells in zip(lists_dict, total_counts.tolist(), n_cells.tolist())
+    }
 
     # Amsterdam totals
-    ams_crs = extract_unique_crs_codes(vehicles_gdf, column=crs_col)
-    counts['Amsterdam'] = len(ams_crs)
+    ams_cells = int(coverage.union_mask(coverage.rows(vehicles_gdf[id_col])).sum())
+    counts['Amsterdam'] = ams_cells
     ams_total_count = vehicles_gdf[count_col].sum()
-    avg_per_cell['Amsterdam'] = round(ams_total_count / len(ams_crs), 2) if len(ams_crs) > 0 else 0
+    avg_per_cell['Amsterdam'] = round(ams_total_count / ams_cells, 2) if ams_cells > 0 else 0
 
     # Insert new rows
     summary_df.loc['cells_unique'] = pd.Series(counts, dtype=int)
@@ -464,8 +474,100 @@ def create_combined_vehicle_df(*dfs):
     return combined_df
 
 
+def draw_random_fleets(n_vehicles, n=10, draws=10000, seed=None, chunk_size=1000):
+    """
+    Draws `draws` random fleets of n distinct vehicle rows with a seeded generator
+    (argpartition of uniform keys, chunked to bound memory).
+
+    Returns:
+        (draws x n) int array of vehicle row positions
+    """
+    rng = np.random.default_rng(seed)
+    n = min(n, n_vehicles)
+    fleets = np.empty((draws, n), dtype=np.int64)
+    for start in range(0, draws, chunk_size):
+        keys = rng.random((min(chunk_size, draws - start), n_vehicles))
+        fleets[start:start + len(keys)] = np.argpartition(keys, n - 1, axis=1)[:, :n]
+    return fleets
+
+
+def summarize_random_fleets(gdf_p, cbs, ams_stats, fleets, coverage=None, id_col='uni_id'):
+    """
+    Every summary row of vehicle_optimization_stats_pipeline for each random fleet,
+    evaluated with the same membership products as the optimized strategies.
+
+    Parameters:
+        gdf_p     : vehicles GeoDataFrame with percentages (calculate_percentages_from_vehicles)
+        cbs       : GeoDataFrame of CBS grid
+        ams_stats : DataFrame of Amsterdam statistics
+        fleets    : (draws x n) vehicle row positions (draw_random_fleets)
+        coverage  : optional CoverageMatrix of gdf_p
+
+    Returns:
+        DataFrame (rows = summary rows, columns = random_0 ... random_{draws-1})
+    """
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(gdf_p, id_col=id_col)
+    ids = gdf_p[id_col].astype(str).to_numpy()
+    lists_dict = {f"random_{i}": ids[fleet].tolist() for i, fleet in enumerate(fleets)}
+    membership = strategy_membership(gdf_p[id_col], lists_dict)
+
+    summary = compute_and_merge_summaries(
+        compute_and_export_sums(gdf_p, lists_dict, id_col=id_col, membership=membership),
+        compute_cbs_summaries(gdf_p, cbs, lists_dict, id_col=id_col, coverage=coverage),
+        gdf_p, lists_dict, id_col=id_col, membership=membership
+    )
+    summary = add_euclidean_distances(summary, ams_stats)
+    summary = add_bus_tram_counts(gdf_p, lists_dict, summary, id_col=id_col, membership=membership)
+    summary = add_unique_route_counts(gdf_p, lists_dict, summary, id_col=id_col, membership=membership)
+    return add_cells_unique_counts(summary, gdf_p, lists_dict, id_col=id_col, coverage=coverage, membership=membership)
+
+
+def random_baseline_distribution(gdf_p, cbs, ams_stats, n=10, draws=10000, seed=None, coverage=None,
+                                 percentiles=(5, 50, 95), chunk_size=2500):
+    """
+    Monte Carlo random baseline: summarizes `draws` random n-vehicle fleets and reports the
+    distribution of every summary row.
+
+    Parameters:
+        gdf_p       : vehicles GeoDataFrame with percentages (calculate_percentages_from_vehicles)
+        cbs         : GeoDataFrame of CBS grid
+        ams_stats   : DataFrame of Amsterdam statistics
+        n           : fleet size (default 10)
+        draws       : number of random fleets (default 10000)
+        seed        : random seed
+        coverage    : optional CoverageMatrix of gdf_p
+        percentiles : percentiles to report (default 5, 50, 95)
+        chunk_size  : fleets summarized per batch (bounds the size of the strategy x cell products)
+
+    Returns:
+        DataFrame (rows = summary rows) with 'random_mean', 'random_std' and 'random_p{q}' columns
+    """
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(gdf_p)
+    fleets = draw_random_fleets(len(gdf_p), n=n, draws=draws, seed=seed, chunk_size=chunk_size)
+
+    summary = pd.concat([
+        summarize_random_fleets(gdf_p, cbs, ams_stats, fleets[start:start + chunk_size], coverage=coverage)
+        for start in range(0, draws, chunk_size)
+    ], axis=1).astype(float)
+
+    values = summary.to_numpy()
+    distribution = pd.DataFrame({
+        'random_mean': np.nanmean(values, axis=1),
+        'random_std': np.nanstd(values, axis=1),
+    }, index=summary.index)
+    for q, column in zip(percentiles, np.nanpercentile(values, percentiles, axis=1)):
+        distribution[f"random_p{q}"] = column
+    return distribution.round(2)
+
+
 # FINAL 1  Random Function 
 def select_random_vehicles(gdf, n=10, seed=None):
+    """
+    One random n-vehicle selection ('random' column). For a distribution of random baselines
+    use vehicle_optimization_stats_pipeline(..., random_draws=...).
+    """
     df = gdf.sample(n=n, random_state=seed)[['uni_id']].reset_index(drop=True)
     df.rename(columns={'uni_id': 'random'}, inplace=True)
     return df
@@ -482,7 +584,10 @@ def vehicle_optimization_stats_pipeline(
     fair_vehicles,
     combined_vehicles,
     random_vehicles, 
-    all_vehicles
+    all_vehicles,
+    coverage=None,
+    random_draws=0,
+    random_seed=None
 ):
     """
     Full pipeline for computing and comparing vehicle optimization strategies.
@@ -496,12 +601,20 @@ def vehicle_optimization_stats_pipeline(
         fair_vehicles      : DataFrame with 'fairest_' columns
         combined_vehicles  : DataFrame with 'combined_opt' column
         random_vehicles    : DataFrame with 'random' column
+        coverage           : optional CoverageMatrix of gdf (see prepare_vehicles_with_stats);
+                             built once here if None
+        random_draws       : number of random fleets (same size as random_vehicles) for a Monte Carlo
+                             baseline; its mean, std and 5/50/95 percentiles are appended as
+                             'random_*' columns (default 0 = off)
+        random_seed        : seed of the random fleets
 
     Returns:
         final_df_cells     : Final summary DataFrame
     """
     # Process vehicles
     gdf_p = calculate_percentages_from_vehicles(gdf)
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(gdf_p)
 
     # Combine all strategy outputs
     combined_df = create_combined_vehicle_df(
@@ -514,20 +627,28 @@ def vehicle_optimization_stats_pipeline(
         all_vehicles
     )
 
-    # Extract dict {strategy: [vehicle_ids]}
+    # Extract dict {strategy: [vehicle_ids]} and the strategy x vehicle membership shared by all summaries
     lists_dict = extract_string_lists(combined_df)
+    membership = strategy_membership(gdf_p['uni_id'], lists_dict)
 
     # Compute summary tables
-    summary_df_1 = compute_and_export_sums(gdf_p, lists_dict)
-    summary_df_2 = compute_cbs_summaries(gdf_p, cbs, lists_dict)
+    summary_df_1 = compute_and_export_sums(gdf_p, lists_dict, membership=membership)
+    summary_df_2 = compute_cbs_summaries(gdf_p, cbs, lists_dict, coverage=coverage)
 
     # Merge and enrich
-    merged_df = compute_and_merge_summaries(summary_df_1, summary_df_2, gdf_p, lists_dict)
+    merged_df = compute_and_merge_summaries(summary_df_1, summary_df_2, gdf_p, lists_dict, membership=membership)
     euclidean_df = add_euclidean_distances(merged_df, ams_stats)
-    trams_buses_df = add_bus_tram_counts(gdf_p, lists_dict, euclidean_df)
-    final_df = add_unique_route_counts(gdf_p, lists_dict, trams_buses_df)
+    trams_buses_df = add_bus_tram_counts(gdf_p, lists_dict, euclidean_df, membership=membership)
+    final_df = add_unique_route_counts(gdf_p, lists_dict, trams_buses_df, membership=membership)
     final_df_city = add_city_column(final_df, ams_stats, cbs, gdf_p)
-    final_df_cells = add_cells_unique_counts(final_df_city, gdf_p, lists_dict)
+    final_df_cells = add_cells_unique_counts(final_df_city, gdf_p, lists_dict, coverage=coverage, membership=membership)
+
+    if random_draws:
+        n = len(lists_dict['random']) if 'random' in lists_dict else 10
+        distribution = random_baseline_distribution(
+            gdf_p, cbs, ams_stats, n=n, draws=random_draws, seed=random_seed, coverage=coverage
+        )
+        final_df_cells = pd.concat([final_df_cells, distribution], axis=1)
 
     return final_df_cells
 
@@ -1,9 +1,59 @@
 import pandas as pd
 import numpy as np
 
+RANK_RULES = ('borda', 'rrf', 'kemeny')
+
+
+def rank_positions(df_sel):
+    """
+    Factorizes the vehicle IDs of the ranked selection columns.
+
+    Returns:
+    - vehicle_ids : unique vehicle IDs in order of first appearance (column by column)
+    - codes       : (n_rows x n_methods) int array of positions in vehicle_ids, -1 for missing IDs
+    """
+    codes, vehicle_ids = pd.factorize(df_sel.to_numpy(dtype=object).ravel(order='F'))
+    return pd.Index(vehicle_ids), codes.reshape(df_sel.shape, order='F')
+
+
+def kemeny_order(codes, n_vehicles, weights, start_order):
+    """
+    Local Kemenization of start_order: adjacent vehicles are swapped while a (weighted) majority
+    of the methods ranks the lower one above the upper one. A vehicle listed by a method ranks above
+    every vehicle that method does not list.
+
+    Parameters:
+    - codes       : (n_rows x n_methods) vehicle positions from rank_positions
+    - n_vehicles  : number of unique vehicles
+    - weights     : weight per method
+    - start_order : initial order of the vehicle positions (e.g. by Borda score)
+
+    Returns:
+    - np.ndarray of vehicle positions, best first
+    """
+    n_rows = codes.shape[0]
+    prefer = np.zeros((n_vehicles, n_vehicles))
+    for method, weight in enumerate(weights):
+        position = np.full(n_vehicles, n_rows)
+        listed = codes[:, method] >= 0
+        np.minimum.at(position, codes[listed, method], np.flatnonzero(listed))
+        prefer += weight * (position[:, None] < position[None, :])
+
+    order = list(start_order)
+    swapped = True
+    while swapped:
+        swapped = False
+        for i in range(len(order) - 1):
+            a, b = order[i], order[i + 1]
+            if prefer[b, a] > prefer[a, b]:
+                order[i], order[i + 1] = b, a
+                swapped = True
+    return np.array(order, dtype=np.int64)
+
+
 # FINAL 
 
-def compute_combined_optimization_scores(combined_df, columns=None, top_n=10):
+def compute_combined_optimization_scores(combined_df, columns=None, top_n=10, weights=None, rule='borda', rrf_k=60):
     """
     Compute combined ranking scores from multiple optimization results.
 
@@ -11,31 +61,56 @@ def compute_combined_optimization_scores(combined_df, columns=None, top_n=10):
     - combined_df : DataFrame with optimization results (columns of ranked vehicle IDs).
     - columns     : Optional list of column names to use for scoring. If None, uses default set.
     - top_n       : Number of top vehicle IDs to return in the final output.
+    - weights     : Optional weight per column (dict column -> weight, or list in column order); default 1 each.
+    - rule        : 'borda'  - rank r (0-based) of n rows scores weight * (n - r) (default),
+                    'rrf'    - reciprocal rank fusion, weight / (rrf_k + r + 1),
+                    'kemeny' - Borda order improved by local Kemenization (pairwise majority swaps);
+                               the score is the number of vehicles ranked below.
+    - rrf_k       : Smoothing constant of the 'rrf' rule (default 60).
 
     Returns:
     - scores_df   : Full score table with optimization memberships.
     - top_n_df    : Top N vehicle IDs in a one-column DataFrame named 'combined_opt'.
+    Missing IDs (shorter columns) are skipped.
     """
     if columns is None:
         columns = ['max_spatial', 'max_A_inhab', 'max_count', 'closest_simple']
+    if rule not in RANK_RULES:
+        raise ValueError(f"Unknown rule '{rule}'. Choose from {RANK_RULES}.")
+
+    df_sel = combined_df[columns]
+    n, n_methods = df_sel.shape
+    if weights is None:
+        weights = np.ones(n_methods, dtype=np.int64)
+    elif isinstance(weights, dict):
+        weights = np.array([weights.get(method, 1) for method in df_sel.columns])
+    else:
+        weights = np.asarray(weights)
+        if len(weights) != n_methods:
+            raise ValueError(f"Expected {n_methods} weights, got {len(weights)}.")
 
-    df_sel = combined_df[columns].copy()
-    n = len(df_sel)
+    vehicle_ids, codes = rank_positions(df_sel)
+    listed = codes >= 0
+    ranks = np.broadcast_to(np.arange(n)[:, None], codes.shape)
+    if rule == 'rrf':
+        points = weights / (rrf_k + ranks + 1)
+    else:
+        points = weights * (n - ranks)
+    scores = np.zeros(len(vehicle_ids), dtype=points.dtype)
+    np.add.at(scores, codes[listed], points[listed])
 
-    scores = {}
-    for method in df_sel.columns:
-        for rank, vid in enumerate(df_sel[method]):
-            points = n - rank
-            scores[vid] = scores.get(vid, 0) + points
+    membership = np.zeros((len(vehicle_ids), n_methods), dtype=bool)
+    membership[codes[listed], np.nonzero(listed)[1]] = True
+    methods = np.array(df_sel.columns, dtype=object)
 
-    methods_map = {
-        vid: [method for method in df_sel.columns if vid in df_sel[method].values]
-        for vid in scores
-    }
+    scores_df = pd.DataFrame({'score': scores}, index=vehicle_ids)
+    scores_df['optimizations'] = [methods[row].tolist() for row in membership]
+    ranked = scores_df.sort_values('score', ascending=False)
 
-    scores_df = pd.DataFrame.from_dict(scores, orient='index', columns=['score'])
-    scores_df['optimizations'] = scores_df.index.map(methods_map)
-    scores_df = scores_df.sort_values('score', ascending=False)
+    if rule == 'kemeny':
+        order = kemeny_order(codes, len(vehicle_ids), weights, vehicle_ids.get_indexer(ranked.index))
+        ranked = scores_df.iloc[order].assign(score=np.arange(len(order) - 1, -1, -1))
+    scores_df = ranked
 
     top_n_df = scores_df.head(top_n).reset_index()[['index']].rename(columns={'index': 'combined_opt'})
     return scores_df, top_n_df
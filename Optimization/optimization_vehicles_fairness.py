@@ -4,12 +4,21 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy.spatial.distance import euclidean
 import numpy as np
+import time
+
+# the nine composition metrics compared with the city profile, in this order everywhere
+FAIRNESS_METRICS = ['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25',
+                    'P_25_45', 'P_45_65', 'P_65+', 'G_woz_woni']
+# population counts behind the eight P_ metrics (same order), then the population and WOZ value
+FAIRNESS_COUNTS = ['A_nederlan', 'A_west_mig', 'A_n_west_m', 'A_0_15', 'A_15_25',
+                   'A_25_45', 'A_45_65', 'A_65+', 'A_inhab', 'G_woz_woni']
 
 def calculate_percentages(gdf):
     """
-    Calculate age group and migration background percentages in-place.
-    Keeps the same logic and structure as provided.
+    Calculate age group and migration background percentages.
+    Works on a copy, the caller's GeoDataFrame is left unchanged.
     """
+    gdf = gdf.copy()
     age_cols = ["A_0_15", "A_15_25", "A_25_45", "A_45_65", "A_65+"]
     for col in age_cols:
         pct_col = f"P_{col.split('_')[1]}" if col != "A_65+" else "P_65+"
@@ -36,21 +45,94 @@ def calculate_percentages(gdf):
     
     return gdf
 
-def calculate_closest_vehicle(gdf, ams_gdf):
-    
-    ams_values = ams_gdf[['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25','P_25_45','P_45_65','P_65+', 'G_woz_woni']].values[0]
-    gdf_values = gdf[['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25','P_25_45','P_45_65', 'P_65+', 'G_woz_woni']].values
+def fairness_distances(values, target):
+    """
+    Euclidean distance of every row of the (n x 9) metric matrix to one target vector.
+    Rows with missing metrics get an infinite distance (idxmin skips them).
+    """
+    distances = np.sqrt(((values - target) ** 2).sum(axis=1))
+    return np.where(np.isnan(distances), np.inf, distances)
+
+def iterative_fairness_selection(values, ams_values, target_n=10, inhabitants=None):
+    """
+    Greedy fairness engine behind iterative_closest_vehicles(_absolute).
+
+    The first pick is the row closest to the city profile. Each next pick is the unselected row closest
+    to the target that would bring the selection back to the profile:
+    - relative (inhabitants=None): target = profile * (k + 1) - sum of the k selected rows
+    - absolute: target = 2 * profile - population-weighted mean of the selected rows
+      (plain mean for G_woz_woni)
+    Running sums of the selection are kept, so each step is one broadcast distance over the metric matrix.
+    Rows with missing metrics (infinite distance) are never picked; the selection stops early when
+    only such rows remain. While the selection has no inhabitants, the absolute target is the profile itself.
 
-    distances = [euclidean(ams_values, row) for row in gdf_values]
+    Parameters:
+    - values      : (n x 9) float array of FAIRNESS_METRICS per vehicle
+    - ams_values  : length-9 city profile
+    - target_n    : number of vehicles to select
+    - inhabitants : A_inhab per vehicle, switches to the absolute (population-weighted) target
+
+    Returns:
+    - selected       : list of row positions in selection order
+    - targets        : list of target vectors (None for the first pick)
+    - step_distances : distance of each pick to its target
+    """
+    n = len(values)
+    available = np.ones(n, dtype=bool)
+    distances = fairness_distances(values, ams_values)
+    first = int(np.argmin(distances))
+    if not np.isfinite(distances[first]):
+        return [], [], []
+    selected, targets, step_distances = [first], [None], [distances[first]]
+    available[first] = False
+
+    # running sums of the selection
+    sums = values[first].copy()
+    if inhabitants is not None:
+        inhab_sum = inhabitants[first]
+        weighted_sums = values[first, :-1] * inhabitants[first]
+
+    while len(selected) < target_n and available.any():
+        if inhabitants is None:
+            target = ams_values * (len(selected) + 1) - sums
+        else:
+            weighted = weighted_sums / inhab_sum if inhab_sum > 0 else ams_values[:-1]
+            real = np.append(weighted, sums[-1] / len(selected))
+            target = ams_values * 2 - real
+
+        distances = np.where(available, fairness_distances(values, target), np.inf)
+        row = int(np.argmin(distances))
+        if not np.isfinite(distances[row]):
+            break
+        selected.append(row)
+        targets.append(target)
+        step_distances.append(distances[row])
+        available[row] = False
 
-    gdf['distance'] = distances
-    gdf.sort_values('distance', ascending=True).head(10)
+        sums += values[row]
+        if inhabitants is not None:
+            inhab_sum += inhabitants[row]
+            weighted_sums += values[row, :-1] * inhabitants[row]
 
-    # Closest vehicle
-    closest_vehicle = gdf.loc[gdf['distance'].idxmin()]
-    closest_vehicle_df = closest_vehicle.to_frame().T
-    closest_vehicle_df.reset_index(drop=True, inplace=True)
+    return selected, targets, step_distances
 
+def selection_frame(gdf, selected, targets, step_distances):
+    """
+    Rows of the selected vehicles in selection order, with the target and distance of every step.
+    """
+    selection = gdf.iloc[selected].reset_index(drop=True)
+    selection['target_values'] = [np.round(t, 2).tolist() if t is not None else np.nan for t in targets]
+    selection['step_distance'] = step_distances
+    return selection
+
+def calculate_closest_vehicle(gdf, ams_gdf):
+    """
+    Adds 'distance': Euclidean distance of every vehicle's FAIRNESS_METRICS to the city profile.
+    Returns a copy.
+    """
+    ams_values = ams_gdf[FAIRNESS_METRICS].values[0].astype(float)
+    gdf = gdf.copy()
+    gdf['distance'] = fairness_distances(gdf[FAIRNESS_METRICS].to_numpy(dtype=float), ams_values)
     return gdf
 
 def select_top_n_vehicles(gdf_closest, n=10):
@@ -61,48 +143,17 @@ def select_top_n_vehicles(gdf_closest, n=10):
 
 
 def iterative_closest_vehicles(gdf_closest, ams_gdf, target_n=10):
-    i = 2
-    ams_values = ams_gdf[['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25', 
-                          'P_25_45', 'P_45_65', 'P_65+', 'G_woz_woni']].values[0]
-    gdf_values = gdf_closest[['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25', 
-                              'P_25_45', 'P_45_65', 'P_65+', 'G_woz_woni']].values
-    distances = [euclidean(ams_values, row) for row in gdf_values]
-    gdf_closest['distance'] = distances
-
-    closest_vehicle_df = gdf_closest.loc[[gdf_closest['distance'].idxmin()]].reset_index(drop=True)
-
-    while len(closest_vehicle_df) < target_n:
-        target_values = np.array([
-            ams_gdf['P_nederlan'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_nederlan'].sum(),
-            ams_gdf['P_west_mig'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_west_mig'].sum(),
-            ams_gdf['P_n_west_m'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_n_west_m'].sum(),
-            ams_gdf['P_0_15'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_0_15'].sum(),
-            ams_gdf['P_15_25'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_15_25'].sum(),
-            ams_gdf['P_25_45'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_25_45'].sum(),
-            ams_gdf['P_45_65'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_45_65'].sum(),
-            ams_gdf['P_65+'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['P_65+'].sum(),
-            ams_gdf['G_woz_woni'].values[0] * (len(closest_vehicle_df) + 1) - closest_vehicle_df['G_woz_woni'].sum()
-        ])
-
-        gdf_values = gdf_closest[['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 'P_15_25', 
-                                  'P_25_45', 'P_45_65', 'P_65+', 'G_woz_woni']].values
-        distances = [euclidean(target_values, row) for row in gdf_values]
-        distance_col = f'distance_{i}'
-        gdf_closest[distance_col] = distances
-
-        existing_vehicle_ids = closest_vehicle_df['uni_id'].values
-        filtered_gdf = gdf_closest[~gdf_closest['uni_id'].isin(existing_vehicle_ids)]
-
-        if not filtered_gdf.empty:
-            closest_row = filtered_gdf.loc[filtered_gdf[distance_col].idxmin()]
-            closest_row_df = closest_row.to_frame().T
-            closest_row_df['target_values'] = [np.round(target_values, 2).tolist()]
-            closest_vehicle_df = pd.concat([closest_vehicle_df, closest_row_df], ignore_index=True)
-        else:
-            break
+    """
+    Relative fairness: each step picks the vehicle that moves the running sum closest to
+    (k + 1) times the city profile. See iterative_fairness_selection.
+    """
+    ams_values = ams_gdf[FAIRNESS_METRICS].values[0].astype(float)
+    gdf_closest = calculate_closest_vehicle(gdf_closest, ams_gdf)
+
+    selected, targets, step_distances = iterative_fairness_selection(
+        gdf_closest[FAIRNESS_METRICS].to_numpy(dtype=float), ams_values, target_n)
+    closest_vehicle_df = selection_frame(gdf_closest, selected, targets, step_distances)
 
-        i += 1
-    
     vehicles_relative = closest_vehicle_df.sort_values('distance', ascending=True).head(target_n)['uni_id'].values
     vehicles_relative = list(vehicles_relative)  
 
@@ -111,50 +162,142 @@ def iterative_closest_vehicles(gdf_closest, ams_gdf, target_n=10):
 
 
 def iterative_closest_vehicles_absolute(gdf, ams_gdf, target_n=10):
-    metrics = ['P_nederlan', 'P_west_mig', 'P_n_west_m', 'P_0_15', 
-               'P_15_25', 'P_25_45', 'P_45_65', 'P_65+', 'G_woz_woni']
-    ams_vals = ams_gdf[metrics].iloc[0].values
-
-    gdf['distance_1'] = [euclidean(ams_vals, row) for row in gdf[metrics].values]
-    closest_vehicle_df = gdf.loc[[gdf['distance_1'].idxmin()]].copy()
-
-    i = 2
-    while len(closest_vehicle_df) < target_n:
-        total_pop = closest_vehicle_df['A_inhab'].sum()
-        real_pct = {
-            m: (closest_vehicle_df[m] * closest_vehicle_df['A_inhab']).sum() / total_pop
-            for m in metrics[:-1]
-        }
-        real_prop = closest_vehicle_df['G_woz_woni'].mean()
+    """
+    Absolute fairness: each step aims at 2 * profile minus the population-weighted composition
+    of the vehicles selected so far. See iterative_fairness_selection.
+    """
+    ams_vals = ams_gdf[FAIRNESS_METRICS].iloc[0].values.astype(float)
+    gdf = calculate_closest_vehicle(gdf, ams_gdf)
 
-        target = np.array([
-            ams_vals[j]*2 - (real_prop if m == 'G_woz_woni' else real_pct[m])
-            for j, m in enumerate(metrics)
-        ])
+    selected, targets, step_distances = iterative_fairness_selection(
+        gdf[FAIRNESS_METRICS].to_numpy(dtype=float), ams_vals, target_n,
+        inhabitants=gdf['A_inhab'].to_numpy(dtype=float))
+    closest_vehicle_df = selection_frame(gdf, selected, targets, step_distances)
 
-        dist_col = f'distance_{i}'
-        gdf[dist_col] = [euclidean(target, row) for row in gdf[metrics].values]
+    vehicles_absolute = closest_vehicle_df.sort_values('distance', ascending=True).head(target_n)['uni_id'].values
+    vehicles_absolute = vehicles_absolute.tolist()
 
-        remaining = gdf[~gdf['uni_id'].isin(closest_vehicle_df['uni_id'])]
-        if remaining.empty:
-            break
+    return closest_vehicle_df, vehicles_absolute
 
-        next_row = remaining.loc[remaining[dist_col].idxmin()].copy()
-        next_row['target_values'] = [np.round(target, 2).tolist()]
 
-        closest_vehicle_df = pd.concat(
-            [closest_vehicle_df, next_row.to_frame().T],
-            ignore_index=True
-        )
-        i += 1
+def selection_composition_distance(sums, k, ams_values):
+    """
+    Distance of selections to the city profile from their summed FAIRNESS_COUNTS,
+    as in create_area_comparison_statistics: population-weighted shares, mean WOZ value.
 
-    vehicles_absolute = closest_vehicle_df.sort_values('distance', ascending=True).head(target_n)['uni_id'].values
-    vehicles_absolute = vehicles_absolute.tolist()
+    Parameters:
+    - sums       : (..., 10) array of FAIRNESS_COUNTS sums per selection
+    - k          : number of vehicles per selection
+    - ams_values : length-9 city profile (FAIRNESS_METRICS)
 
-    return closest_vehicle_df, vehicles_absolute
+    Returns:
+    - array of Euclidean distances, one per selection
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = sums[..., :8] / sums[..., 8:9] * 100
+    composition = np.concatenate([shares, sums[..., 9:] / k], axis=-1)
+    distances = np.sqrt(((composition - ams_values) ** 2).sum(axis=-1))
+    return np.where(np.isnan(distances), np.inf, distances)
+
+def refine_fairness_selection(gdf, ams_gdf, selected_ids, max_iter=100, time_budget=None, pool_size=50):
+    """
+    First-improvement swap local search on a fairness selection.
 
+    The objective is the selection's population-weighted composition distance to the city profile
+    (the 'Distance' of create_area_comparison_statistics). The FAIRNESS_COUNTS sums of the selection
+    are cached, so a candidate swap costs one O(d) update of those sums:
+    - 1-swap: for each selected vehicle (in order), the best replacement among all unselected
+      vehicles is taken as soon as it improves the objective.
+    - 2-swap: only when no 1-swap improves; pairs of selected vehicles are replaced by pairs from
+      the pool_size unselected vehicles with the best single-swap objective.
+    The search stops at a local optimum, after max_iter accepted swaps or after time_budget seconds.
 
-def create_area_comparison_statistics(ams_gdf, df_closest, df_rel, df_abs):
+    Parameters:
+    - gdf          : GeoDataFrame of vehicles with FAIRNESS_COUNTS and 'uni_id'
+    - ams_gdf      : GeoDataFrame with the city profile (FAIRNESS_METRICS)
+    - selected_ids : uni_ids of the starting selection
+    - max_iter     : maximum number of accepted swaps (default 100)
+    - time_budget  : maximum runtime in seconds (default None = no limit)
+    - pool_size    : number of unselected vehicles considered for 2-swaps (default 50)
+
+    Returns:
+    - refined_df  : rows of the refined selection (replacements take the place of the vehicles
+                    they swap out); attrs hold 'objective_start', 'objective_end' and 'swaps'
+    - refined_ids : list of refined uni_ids
+    """
+    start_time = time.perf_counter()
+    ams_values = ams_gdf[FAIRNESS_METRICS].values[0].astype(float)
+    counts = np.nan_to_num(gdf[FAIRNESS_COUNTS].to_numpy(dtype=float))
+
+    selected = [int(r) for r in np.flatnonzero(gdf['uni_id'].astype(str).isin(pd.Index(selected_ids).astype(str)))]
+    order = {uid: i for i, uid in enumerate(pd.Index(selected_ids).astype(str))}
+    selected.sort(key=lambda r: order[str(gdf['uni_id'].iloc[r])])
+    k = len(selected)
+
+    in_selection = np.zeros(len(gdf), dtype=bool)
+    in_selection[selected] = True
+    sums = counts[selected].sum(axis=0)
+    objective_start = objective = float(selection_composition_distance(sums, k, ams_values))
+
+    def out_of_time():
+        return time_budget is not None and time.perf_counter() - start_time > time_budget
+
+    swaps = 0
+    while swaps < max_iter and not out_of_time():
+        outside = np.flatnonzero(~in_selection)
+        if len(outside) == 0:
+            break
+        improved = False
+
+        # 1-swap: selected position i out, best unselected vehicle in
+        best_per_candidate = np.full(len(outside), np.inf)
+        for i, row in enumerate(selected):
+            candidate = selection_composition_distance(sums - counts[row] + counts[outside], k, ams_values)
+            best_per_candidate = np.minimum(best_per_candidate, candidate)
+            j = int(np.argmin(candidate))
+            if candidate[j] < objective - 1e-12:
+                new_row = int(outside[j])
+                sums += counts[new_row] - counts[row]
+                in_selection[row], in_selection[new_row] = False, True
+                selected[i] = new_row
+                objective = float(candidate[j])
+                improved = True
+                break
+            if out_of_time():
+                break
+
+        # 2-swap: two selected out, two from the candidate pool in
+        if not improved and k >= 2 and len(outside) >= 2 and not out_of_time():
+            pool = outside[np.argsort(best_per_candidate, kind='stable')[:pool_size]]
+            p1, p2 = np.triu_indices(len(pool), k=1)
+            pair_counts = counts[pool[p1]] + counts[pool[p2]]
+            for i1 in range(k):
+                for i2 in range(i1 + 1, k):
+                    out_counts = counts[selected[i1]] + counts[selected[i2]]
+                    candidate = selection_composition_distance(sums - out_counts + pair_counts, k, ams_values)
+                    j = int(np.argmin(candidate))
+                    if candidate[j] < objective - 1e-12:
+                        new_rows = int(pool[p1[j]]), int(pool[p2[j]])
+                        sums += counts[list(new_rows)].sum(axis=0) - out_counts
+                        in_selection[[selected[i1], selected[i2]]] = False
+                        in_selection[list(new_rows)] = True
+                        selected[i1], selected[i2] = new_rows
+                        objective = float(candidate[j])
+                        improved = True
+                        break
+                if improved or out_of_time():
+                    break
+
+        if not improved:
+            break
+        swaps += 1
+
+    refined_df = gdf.iloc[selected].reset_index(drop=True)
+    refined_df.attrs.update({'objective_start': objective_start, 'objective_end': objective, 'swaps': swaps})
+    return refined_df, refined_df['uni_id'].tolist()
+
+
+def create_area_comparison_statistics(ams_gdf, df_closest, df_rel, df_abs, df_refined=None):
     """
     Creates a DataFrame comparing Amsterdam average with optimized sensing stats
     using absolute, relative, and closest vehicle methods.
@@ -164,6 +307,7 @@ def create_area_comparison_statistics(ams_gdf, df_closest, df_rel, df_abs):
     - df_abs    : GeoDataFrame of absolute optimization vehicles
     - df_rel    : GeoDataFrame of relative optimization vehicles
     - df_closest: GeoDataFrame of closest match optimization vehicles
+    - df_refined: optional GeoDataFrame of the swap-refined selection (adds a 'percentages_refined' row)
 
     Returns:
     - df_area_statistics : DataFrame with percentages + Euclidean distances
@@ -221,10 +365,18 @@ def create_area_comparison_statistics(ams_gdf, df_closest, df_rel, df_abs):
     distances = [euclidean(amsterdam_avg, p) for p in percentages_list]
     data['Distance'] = [0] + distances
 
+    if df_refined is not None:
+        percentages_refined = calculate_percentages2(df_refined)
+        for k in percentages_refined:
+            data[k].append(percentages_refined[k])
+        data['Area'].append('percentages_refined')
+        data['Date'].append(data['Date'][-1])
+        data['Distance'].append(euclidean(amsterdam_avg, [percentages_refined[k] for k in FAIRNESS_METRICS]))
+
     return pd.DataFrame(data).round(2)
 
 
-def generate_optimization_vehicle_table(closest_absolute, closest_relative, closest_closest, n):
+def generate_optimization_vehicle_table(closest_absolute, closest_relative, closest_closest, n, closest_refined=None):
     """
     Create tables of vehicle IDs from different optimization strategies.
 
@@ -232,6 +384,7 @@ def generate_optimization_vehicle_table(closest_absolute, closest_relative, clos
     - closest_absolute : GeoDataFrame of absolute optimization vehicles
     - closest_relative : GeoDataFrame of relative optimization vehicles
     - closest_closest  : GeoDataFrame of closest-match optimization vehicles
+    - closest_refined  : optional GeoDataFrame of the swap-refined selection (adds 'fair_refined' / 'closest_refined')
 
     Returns:
     - df_optimizations : DataFrame with all vehicle IDs per optimization
@@ -252,20 +405,30 @@ def generate_optimization_vehicle_table(closest_absolute, closest_relative, clos
         'closest_simple':  closest_closest['uni_id'].tolist()[:n]
     })
 
+    if closest_refined is not None:
+        df_optimizations.loc[len(df_optimizations)] = ['fair_refined', closest_refined['uni_id'].tolist()]
+        df_vehicle_ids['closest_refined'] = pd.Series(closest_refined['uni_id'].tolist()[:n])
+
     return df_optimizations, df_vehicle_ids
 
 # FINAL FUNCTION
 
 # PIPELINE
 
-def run_fairness_pipeline(gdf, ams_gdf, n=10):
+def run_fairness_pipeline(gdf, ams_gdf, n=10, refine=False, max_iter=100, time_budget=None):
     """
     Executes the full fairness workflow in the correct order, using the same top-N for all three methods.
 
+    With refine=True the relative selection is improved by swap local search (refine_fairness_selection)
+    and added as 'fair_refined' / 'closest_refined' / 'percentages_refined' to the three tables.
+
     Parameters:
-    - gdf     : GeoDataFrame with vehicle % columns
-    - ams_gdf : GeoDataFrame with Amsterdam stats
-    - n       : number of top vehicles to select for simple, relative, and absolute optimization
+    - gdf         : GeoDataFrame with vehicle % columns
+    - ams_gdf     : GeoDataFrame with Amsterdam stats
+    - n           : number of top vehicles to select for simple, relative, and absolute optimization
+    - refine      : also run the swap refinement on the relative selection (default False)
+    - max_iter    : maximum number of accepted swaps for the refinement
+    - time_budget : maximum refinement runtime in seconds (default None = no limit)
 
     Returns:
     - df_area_statistics : DataFrame comparing area-level stats
@@ -292,16 +455,23 @@ def run_fairness_pipeline(gdf, ams_gdf, n=10):
     closest_relative, _ = iterative_closest_vehicles(gdf_closest, ams_gdf, target_n=n)
 
     # 6) absolute iterative
-    closest_absolute, _ = iterative_closest_vehicles_absolute(gdf_p, ams_gdf, target_n=n)
+    closest_absolute, _ = iterative_closest_vehicles_absolute(gdf_closest, ams_gdf, target_n=n)
+
+    # 6b) optional swap refinement of the relative selection
+    closest_refined = None
+    if refine:
+        closest_refined, _ = refine_fairness_selection(
+            gdf_closest, ams_gdf, closest_relative['uni_id'], max_iter=max_iter, time_budget=time_budget
+        )
 
     # 7) area-level comparison
     df_area_statistics = create_area_comparison_statistics(
-        ams_gdf, closest_simple, closest_relative, closest_absolute
+        ams_gdf, closest_simple, closest_relative, closest_absolute, df_refined=closest_refined
     )
 
     # 8) compile vehicle ID tables
     df_optimizations, df_vehicle_ids = generate_optimization_vehicle_table(
-        closest_absolute, closest_relative, closest_simple, n
+        closest_absolute, closest_relative, closest_simple, n, closest_refined=closest_refined
     )
 
     return closest_simple, closest_relative, closest_absolute, df_area_statistics, df_optimizations, df_vehicle_ids
@@ -6,6 +6,7 @@ from scipy.spatial.distance import euclidean
 import numpy as np
 from typing import Dict, List, Tuple
 import geopandas as gpd
+from .coverage_matrix import CoverageMatrix
 
 
 def compute_top10(gdf: gpd.GeoDataFrame, n: int = 10) -> dict:
@@ -39,7 +40,8 @@ def analyze_tops_with_cbs(
     tops: Dict[str, gpd.GeoDataFrame],
     cbs_gdf: gpd.GeoDataFrame,
     list_col: str = 'crs28922_list',
-    code_col: str = 'crs28992'
+    code_col: str = 'crs28992',
+    coverage: CoverageMatrix = None
 ) -> Tuple[
     Dict[str, List[str]],       # cbs_lists
     Dict[str, int],             # max_number
@@ -53,6 +55,8 @@ def analyze_tops_with_cbs(
          - for 'max_point_count' → sum the vehicle 'count'
          - otherwise → sum the matching A_… column in CBS
 
+    The vehicle → cell lists come from `coverage`; if None it is built once from list_col.
+
     Returns three dicts keyed by metric name:
       - cbs_lists    : list of unique CRS codes
       - max_number   : summed total (int)
@@ -62,23 +66,20 @@ def analyze_tops_with_cbs(
     max_number:   Dict[str, int]                 = {}
     gdf_filtered: Dict[str, gpd.GeoDataFrame]    = {}
 
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(pd.concat(tops.values()).drop_duplicates('uni_id'), list_col=list_col)
+    cbs_cols = coverage.cbs_columns(cbs_gdf, code_col)
+
     for metric, df in tops.items():
         raw_col = metric.replace('max_', '')              # e.g. 'A_inhab', 'P_65+', or 'count'
         sum_col = raw_col if not raw_col.startswith('P_') else raw_col.replace('P_', 'A_')
 
         # 1) collect all unique CBS codes
-        codes = set()
-        for val in df[list_col]:
-            if isinstance(val, list):
-                codes.update(val)
-            elif isinstance(val, str):
-                inner = val.strip("[]")
-                parts = [p.strip(" '\"") for p in inner.replace("', '", ",").split(",") if p.strip()]
-                codes.update(parts)
-        cbs_lists[metric] = list(codes)
+        rows = coverage.rows(df['uni_id'])
+        cbs_lists[metric] = coverage.cells(df['uni_id'], as_str=True).tolist()
 
         # 2) filter CBS cells (always)
-        cells = cbs_gdf[cbs_gdf[code_col].isin(codes)].copy()
+        cells = cbs_gdf[coverage.covered_cbs_rows(rows, cbs_cols)].copy()
         gdf_filtered[metric] = cells
 
         # 3) compute total
@@ -144,7 +145,8 @@ def create_summary_df_from_tops(tops: dict[str, pd.DataFrame]) -> pd.DataFrame:
 def run_max_coverage_pipeline(
     gdf: gpd.GeoDataFrame,
     cbs_gdf: gpd.GeoDataFrame,
-    n: int = 10
+    n: int = 10,
+    coverage: CoverageMatrix = None
 ):
     """
     1) Compute top-n vehicles per max_* metric
@@ -152,9 +154,10 @@ def run_max_coverage_pipeline(
     3) Build a summary table of uni_id selections
 
     Parameters:
-      - gdf     : vehicles GeoDataFrame
-      - cbs_gdf : CBS cells GeoDataFrame with 'crs28992' and A_* columns
-      - n       : number of top vehicles to pick for each metric
+      - gdf      : vehicles GeoDataFrame
+      - cbs_gdf  : CBS cells GeoDataFrame with 'crs28992' and A_* columns
+      - n        : number of top vehicles to pick for each metric
+      - coverage : optional CoverageMatrix of gdf (see prepare_vehicles_with_stats)
 
     Returns:
       - tops           : dict of GeoDataFrames (one per 'max_*')
@@ -167,7 +170,7 @@ def run_max_coverage_pipeline(
     tops = compute_top10(gdf, n=n)
 
     # 2) get CBS coverage info
-    cbs_lists, max_number, gdf_filtered = analyze_tops_with_cbs(tops, cbs_gdf)
+    cbs_lists, max_number, gdf_filtered = analyze_tops_with_cbs(tops, cbs_gdf, coverage=coverage)
 
     # 3) make a summary table of uni_id lists
     summary_df = create_summary_df_from_tops(tops)
@@ -0,0 +1,241 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from .coverage_matrix import CoverageMatrix
+from .optimization_vehicles_fairness import FAIRNESS_METRICS, FAIRNESS_COUNTS, selection_composition_distance
+
+# objectives of a vehicle set; the first three are maximized, the fairness distance is minimized
+PARETO_OBJECTIVES = ['cells', 'inhabitants', 'points', 'fairness_distance']
+
+
+def build_objective_data(vehicles_gdf, cbs_gdf, ams_gdf, coverage=None, id_col='uni_id', list_col='crs28922_list',
+                         code_col='crs28992'):
+    """
+    Collects everything the set objectives need, aligned to the rows of vehicles_gdf.
+
+    Parameters:
+    - vehicles_gdf : GeoDataFrame of vehicles with 'uni_id', 'count', 'G_woz_woni' and the cell lists
+    - cbs_gdf      : CBS GeoDataFrame with 'crs28992' and the A_ population columns
+    - ams_gdf      : GeoDataFrame with the city profile (FAIRNESS_METRICS)
+    - coverage     : optional CoverageMatrix; built from list_col if None
+
+    Returns:
+    - dict with the vehicle x cell incidence 'X' (CSR), per-cell population counts 'W'
+      (FAIRNESS_COUNTS without G_woz_woni), per-vehicle 'points' and 'woz', the city profile 'ams'
+      and the vehicle 'ids'
+    """
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(vehicles_gdf, id_col=id_col, list_col=list_col)
+
+    X = coverage.aligned(vehicles_gdf[id_col]).astype(np.float64)
+
+    # population counts of every covered CBS cell (cells missing from the CBS grid count 0)
+    cbs_cols = coverage.cbs_columns(cbs_gdf, code_col)
+    W = np.zeros((coverage.n_cells, len(FAIRNESS_COUNTS) - 1))
+    known = cbs_cols >= 0
+    np.add.at(W, cbs_cols[known], np.nan_to_num(cbs_gdf.loc[known, FAIRNESS_COUNTS[:-1]].to_numpy(dtype=float)))
+
+    return {
+        'X': X,
+        'W': W,
+        'points': np.nan_to_num(vehicles_gdf['count'].to_numpy(dtype=float)),
+        'woz': np.nan_to_num(vehicles_gdf['G_woz_woni'].to_numpy(dtype=float)),
+        'ams': ams_gdf[FAIRNESS_METRICS].values[0].astype(float),
+        'ids': vehicles_gdf[id_col].to_numpy(),
+    }
+
+
+def objectives_from_sums(cells, counts, points, woz, k, ams):
+    """
+    Objective matrix (n x 4, PARETO_OBJECTIVES order) from covered-cell sums and vehicle sums.
+    Inhabitants come from the covered cells, the fairness distance uses the covered cells'
+    composition and the vehicles' mean WOZ value (as in the optimization stats table).
+    """
+    distance = selection_composition_distance(np.column_stack([counts, woz]), k, ams)
+    return np.column_stack([cells, counts[:, -1], points, distance])
+
+
+def evaluate_vehicle_sets(sets, data):
+    """
+    Evaluates many vehicle sets at once: membership @ incidence gives the cover counts per set.
+
+    Parameters:
+    - sets : (n_sets x k) array of vehicle row positions
+    - data : output of build_objective_data
+
+    Returns:
+    - (n_sets x 4) array of PARETO_OBJECTIVES
+    """
+    sets = np.asarray(sets, dtype=np.int64)
+    n_sets, k = sets.shape
+    membership = sparse.csr_matrix(
+        (np.ones(sets.size), (np.repeat(np.arange(n_sets), k), sets.ravel())),
+        shape=(n_sets, data['X'].shape[0])
+    )
+    covered = (membership @ data['X']) > 0
+    cells = np.asarray(covered.sum(axis=1)).ravel()
+    counts = np.asarray(covered @ data['W'])
+    return objectives_from_sums(cells, counts, membership @ data['points'], membership @ data['woz'], k, data['ams'])
+
+
+def swap_neighbourhood(vehicle_set, data):
+    """
+    All sets one swap away from vehicle_set (one member out, one outside vehicle in), evaluated incrementally.
+
+    The cover counts of the set are computed once; for each member u the cells only u covers are
+    released, and the gain of every outside vehicle is one sparse product with the uncovered cells.
+
+    Parameters:
+    - vehicle_set : array of k vehicle row positions
+    - data        : output of build_objective_data
+
+    Returns:
+    - sets       : (n x k) array of the neighbouring sets
+    - objectives : (n x 4) array of PARETO_OBJECTIVES
+    """
+    X, W = data['X'], data['W']
+    vehicle_set = np.asarray(vehicle_set, dtype=np.int64)
+    k = len(vehicle_set)
+    outside = np.setdiff1d(np.arange(X.shape[0]), vehicle_set)
+    X_out = X[outside]
+    cover = np.asarray(X[vehicle_set].sum(axis=0)).ravel()
+    points, woz = data['points'][vehicle_set].sum(), data['woz'][vehicle_set].sum()
+
+    sets, objectives = [], []
+    for i, u in enumerate(vehicle_set):
+        cover_u = cover - X[u].toarray().ravel()
+        uncovered = (cover_u == 0).astype(np.float64)
+        base_counts = W.T @ (cover_u > 0)
+
+        cells = (cover_u > 0).sum() + X_out @ uncovered
+        counts = base_counts + X_out @ (W * uncovered[:, None])
+        objectives.append(objectives_from_sums(
+            cells, counts,
+            points - data['points'][u] + data['points'][outside],
+            woz - data['woz'][u] + data['woz'][outside],
+            k, data['ams']
+        ))
+
+        neighbours = np.repeat(vehicle_set[None, :], len(outside), axis=0)
+        neighbours[:, i] = outside
+        sets.append(neighbours)
+
+    return np.vstack(sets), np.vstack(objectives)
+
+
+def pareto_front(objectives):
+    """
+    Non-dominated rows of an objective matrix (PARETO_OBJECTIVES: maximize the first three,
+    minimize the fairness distance). Of rows with identical objectives only the first is kept.
+
+    Returns:
+    - boolean mask of the non-dominated rows
+    """
+    values = np.asarray(objectives, dtype=float) * np.array([1, 1, 1, -1])
+    order = np.lexsort(values.T[::-1] * -1)  # best first on the first objective, then the next ones
+    keep = np.zeros(len(values), dtype=bool)
+    front = np.empty((0, values.shape[1]))
+    for row in order:
+        candidate = values[row]
+        if len(front) and (np.all(front >= candidate, axis=1)).any():
+            continue  # dominated by, or equal to, a row already on the front
+        keep[row] = True
+        front = np.vstack([front, candidate])
+    return keep
+
+
+def dominated_by(objectives, front_objectives):
+    """Mask of rows of objectives that are dominated by, or equal to, some row of front_objectives."""
+    sign = np.array([1, 1, 1, -1])
+    values, front = objectives * sign, front_objectives * sign
+    dominated = np.zeros(len(values), dtype=bool)
+    for chunk in range(0, len(values), 2048):
+        block = values[chunk:chunk + 2048, None, :]
+        dominated[chunk:chunk + 2048] = np.all(front[None, :, :] >= block, axis=2).any(axis=1)
+    return dominated
+
+
+# FINAL FUNCTION
+
+def pareto_optimization_pipeline(vehicles_gdf, cbs_gdf, ams_gdf, top_n=10, seed_sets=None, n_random=1000,
+                                 max_evaluations=200000, time_budget=30, coverage=None, seed=None):
+    """
+    Multi-objective selection of top_n vehicles: cells covered, inhabitants covered, point count
+    (maximized) and fairness distance to the city profile (minimized).
+
+    Candidate sets are evaluated directly on the shared vehicle x cell incidence. The search starts
+    from the seed sets (e.g. the other optimizers' selections) and n_random random sets, then runs a
+    Pareto local search: every front member's full swap neighbourhood is evaluated incrementally
+    and merged into the front, until no member is left unexplored or a budget runs out.
+
+    Parameters:
+    - vehicles_gdf    : GeoDataFrame of vehicles (prepare_vehicles_with_stats output)
+    - cbs_gdf         : CBS GeoDataFrame with 'crs28992' and the A_ population columns
+    - ams_gdf         : GeoDataFrame with the city profile
+    - top_n           : set size (default 10)
+    - seed_sets       : optional dict label -> list of uni_ids (e.g. columns of combine_optimized_dfs)
+    - n_random        : number of random starting sets (default 1000)
+    - max_evaluations : maximum number of evaluated sets (default 200000)
+    - time_budget     : maximum runtime in seconds (default 30)
+    - coverage        : optional CoverageMatrix of the vehicles
+    - seed            : random seed
+
+    Returns:
+    - front_df : DataFrame of the non-dominated sets with 'vehicles' (list of uni_ids), 'source'
+                 and the PARETO_OBJECTIVES, sorted by cells (desc); attrs hold 'evaluations' and 'elapsed'
+    """
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    data = build_objective_data(vehicles_gdf, cbs_gdf, ams_gdf, coverage=coverage)
+    n_vehicles = len(data['ids'])
+    k = min(top_n, n_vehicles)
+
+    # starting sets: seeds of exactly k known vehicles, then random draws
+    start_sets, sources = [], []
+    id_position = pd.Index(pd.Series(data['ids']).astype(str))
+    for label, ids in (seed_sets or {}).items():
+        rows = id_position.get_indexer(pd.Series(ids).dropna().astype(str))
+        rows = pd.unique(rows[rows >= 0])[:k]
+        if len(rows) == k:
+            start_sets.append(rows)
+            sources.append(label)
+    if n_random > 0:
+        start_sets.extend(np.argpartition(rng.random((n_random, n_vehicles)), k - 1, axis=1)[:, :k])
+        sources.extend(['random'] * n_random)
+
+    front_sets = np.sort(np.array(start_sets, dtype=np.int64).reshape(-1, k), axis=1)
+    front_objectives = evaluate_vehicle_sets(front_sets, data)
+    front_sources = np.array(sources, dtype=object)
+    evaluations = len(front_sets)
+
+    keep = pareto_front(front_objectives)
+    front_sets, front_objectives, front_sources = front_sets[keep], front_objectives[keep], front_sources[keep]
+    explored = np.zeros(len(front_sets), dtype=bool)
+
+    # Pareto local search over swap neighbourhoods
+    while not explored.all() and evaluations < max_evaluations and time.perf_counter() - start_time < time_budget:
+        member = int(np.flatnonzero(~explored)[0])
+        explored[member] = True
+        sets, objectives = swap_neighbourhood(front_sets[member], data)
+        evaluations += len(sets)
+
+        new = ~dominated_by(objectives, front_objectives)
+        if not new.any():
+            continue
+        sets, objectives = np.sort(sets[new], axis=1), objectives[new]
+
+        all_sets = np.vstack([front_sets, sets])
+        all_objectives = np.vstack([front_objectives, objectives])
+        keep = pareto_front(all_objectives)
+        front_sets, front_objectives = all_sets[keep], all_objectives[keep]
+        front_sources = np.concatenate([front_sources, np.full(len(sets), 'swap', dtype=object)])[keep]
+        explored = np.concatenate([explored, np.zeros(len(sets), dtype=bool)])[keep]
+
+    front_df = pd.DataFrame(front_objectives, columns=PARETO_OBJECTIVES)
+    front_df[['cells', 'points']] = front_df[['cells', 'points']].astype(int)
+    front_df.insert(0, 'source', front_sources)
+    front_df.insert(0, 'vehicles', [data['ids'][s].tolist() for s in front_sets])
+    front_df = front_df.sort_values(['cells', 'fairness_distance'], ascending=[False, True]).reset_index(drop=True)
+    front_df.attrs.update({'evaluations': evaluations, 'elapsed': time.perf_counter() - start_time})
+    return front_df
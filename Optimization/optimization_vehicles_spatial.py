@@ -5,6 +5,9 @@ import seaborn as sns
 #from scipy.spatial.distance import euclidean
 import numpy as np
 import math
+import heapq
+import time
+from .coverage_matrix import CoverageMatrix
 
 # STEP 1 ADD TITUS OPTIMIYATION AND FINISh
 
@@ -140,6 +143,182 @@ def select_vehicles_for_max_coverage(points_gdf, vehicle_unique_ids, coverage_th
 
     return selected_uni_ids_df
 
+def build_vehicle_cell_incidence(points_gdf):
+    """
+    Builds the vehicle -> CBS-cell incidence once as a CoverageMatrix.
+    Rows are sorted like gdf.groupby('uni_id') so ties resolve exactly as in find_next_group.
+    Points outside the CBS grid (NaN 'id') do not count as a covered cell.
+
+    Parameters:
+    - points_gdf : GeoDataFrame with 'uni_id' and 'id' (CBS cell ID), see prepare_vehicle_unique_ids.
+
+    Returns:
+    - coverage   : CoverageMatrix of point-in-cell coverage per vehicle
+    """
+    return CoverageMatrix.from_pairs(points_gdf['uni_id'], points_gdf['id'])
+
+
+def select_vehicles_lazy_greedy(points_gdf, vehicle_unique_ids, coverage_threshold=3, coverage=None):
+    """
+    Greedy max coverage as in select_vehicles_for_max_coverage, computed with CELF lazy greedy:
+    marginal gains sit in a priority queue and only the top entry is re-evaluated,
+    since gains can only shrink as coverage grows.
+
+    Deliberate difference: points outside the CBS grid (NaN 'id') are not a cell here, while
+    select_vehicles_for_max_coverage counts them as one extra coverable "cell". A vehicle's first
+    out-of-grid point therefore no longer adds 1 to its gain, so on feeds with such points the
+    picks and the threshold stop can differ from method='greedy'. Without them the selection is the same.
+
+    Parameters:
+    - points_gdf          : GeoDataFrame with 'uni_id' and 'id' (CBS cell ID).
+    - vehicle_unique_ids  : DataFrame with 'unique_id_count' per vehicle, indexed by 'uni_id'.
+    - coverage_threshold  : Minimum increase in coverage to continue selection (default = 3).
+    - coverage            : optional prebuilt CoverageMatrix; built from points_gdf if None.
+
+    Returns:
+    - selected_uni_ids_df : DataFrame of selected vehicles with their 'unique_id_count'.
+    """
+    if coverage is None:
+        coverage = build_vehicle_cell_incidence(points_gdf)
+
+    vehicle_ids = coverage.vehicle_ids
+    indptr, indices = coverage.matrix.indptr, coverage.matrix.indices
+    covered = np.zeros(coverage.n_cells, dtype=bool)
+
+    # heap entries are (-gain upper bound, row); the row breaks ties in groupby order
+    heap = [(-int(indptr[v + 1] - indptr[v]), v) for v in range(len(vehicle_ids))]
+    heapq.heapify(heap)
+
+    selected_uni_ids = []
+    while heap:
+        neg_bound, v = heapq.heappop(heap)
+        cells = indices[indptr[v]:indptr[v + 1]]
+        gain = int(np.count_nonzero(~covered[cells]))
+
+        # stale bound: push back with the fresh gain and look again
+        if gain < -neg_bound:
+            heapq.heappush(heap, (-gain, v))
+            continue
+
+        if gain <= coverage_threshold:
+            break
+
+        covered[cells] = True
+        selected_uni_ids.append(vehicle_ids[v])
+
+    selected_uni_ids_df = pd.DataFrame({'uni_id': selected_uni_ids}).merge(
+        vehicle_unique_ids, on='uni_id', how='left'
+    )
+
+    return selected_uni_ids_df
+
+def select_vehicles_exact(points_gdf, vehicle_unique_ids, top_n=10, time_budget=60, coverage=None):
+    """
+    Exact max coverage: the top_n vehicles that together cover the most CBS cells, by branch and bound.
+
+    Every vehicle's cells are a Python int bitset, so unions are '|' and gains are bit counts.
+    A node with r picks left is bounded by its coverage plus the r largest marginal gains of the
+    remaining candidates (valid because gains only shrink as coverage grows). Branches whose bound
+    cannot beat the incumbent are pruned; the greedy solution is the first incumbent.
+    When the time budget runs out, the best set so far is returned and the largest bound of the
+    unexplored branches gives the proven upper bound.
+
+    Parameters:
+    - points_gdf          : GeoDataFrame with 'uni_id' and 'id' (CBS cell ID).
+    - vehicle_unique_ids  : DataFrame with 'unique_id_count' per vehicle, indexed by 'uni_id'.
+    - top_n               : number of vehicles to select (default 10).
+    - time_budget         : wall-clock budget in seconds (default 60).
+    - coverage            : optional prebuilt CoverageMatrix; built from points_gdf if None.
+
+    Returns:
+    - selected_uni_ids_df : DataFrame of the selected vehicles (in greedy order) with their 'unique_id_count'.
+    - report              : dict with 'best_coverage', 'greedy_coverage', 'upper_bound', 'gap'
+                            (upper_bound - best), 'greedy_gap' (upper_bound - greedy), 'optimal',
+                            'nodes' and 'elapsed' (seconds).
+    """
+    start_time = time.perf_counter()
+    if coverage is None:
+        coverage = build_vehicle_cell_incidence(points_gdf)
+
+    # one bitset per vehicle
+    bits = []
+    for v in range(coverage.n_vehicles):
+        row = np.zeros(coverage.n_cells, dtype=bool)
+        row[coverage.row_cells(v)] = True
+        bits.append(int.from_bytes(np.packbits(row, bitorder='little').tobytes(), 'little'))
+
+    k = min(top_n, coverage.n_vehicles)
+
+    def greedy_order(rows, limit):
+        """Greedy picks (largest marginal gain, first row on ties) and their coverage."""
+        rows, ordered, covered = list(rows), [], 0
+        while rows and len(ordered) < limit:
+            gains = [(bits[v] & ~covered).bit_count() for v in rows]
+            pick = rows.pop(int(np.argmax(gains)))
+            ordered.append(pick)
+            covered |= bits[pick]
+        return ordered, covered.bit_count()
+
+    greedy_rows, greedy_coverage = greedy_order(range(coverage.n_vehicles), k)
+    best = {'coverage': greedy_coverage, 'rows': greedy_rows}
+    nodes = 0
+    timed_out = False
+
+    def search(chosen, covered, covered_count, candidates):
+        """Depth-first branch and bound; returns the largest bound left unexplored (-1 if none)."""
+        nonlocal nodes, timed_out
+        nodes += 1
+        picks_left = k - len(chosen)
+
+        # candidates by marginal gain (desc), zero gains cannot add coverage
+        gains = sorted(((-(bits[v] & ~covered).bit_count(), v) for v in candidates))
+        order = [v for g, v in gains if g < 0]
+        gains = [-g for g, v in gains if g < 0]
+
+        if picks_left == 0 or not order:
+            if covered_count > best['coverage']:
+                best['coverage'], best['rows'] = covered_count, list(chosen)
+            return -1
+
+        for j, v in enumerate(order):
+            # bound: this gain plus the best picks_left - 1 gains after it; non-increasing in j
+            bound = covered_count + gains[j] + sum(gains[j + 1:j + picks_left])
+            if bound <= best['coverage']:
+                break
+            if time.perf_counter() - start_time > time_budget:
+                timed_out = True
+                return bound
+
+            chosen.append(v)
+            unexplored = search(chosen, covered | bits[v], covered_count + gains[j], order[j + 1:])
+            chosen.pop()
+
+            if timed_out:
+                next_bound = covered_count + gains[j + 1] + sum(gains[j + 2:j + 1 + picks_left]) if j + 1 < len(order) else -1
+                return max(unexplored, next_bound)
+        return -1
+
+    unexplored = search([], 0, 0, [v for v in range(coverage.n_vehicles) if bits[v]])
+    upper_bound = max(best['coverage'], unexplored)
+
+    report = {
+        'best_coverage': best['coverage'],
+        'greedy_coverage': greedy_coverage,
+        'upper_bound': upper_bound,
+        'gap': upper_bound - best['coverage'],
+        'greedy_gap': upper_bound - greedy_coverage,
+        'optimal': not timed_out,
+        'nodes': nodes,
+        'elapsed': time.perf_counter() - start_time,
+    }
+
+    selected_uni_ids = [coverage.vehicle_ids[v] for v in greedy_order(best['rows'], k)[0]]
+    selected_uni_ids_df = pd.DataFrame({'uni_id': selected_uni_ids}).merge(
+        vehicle_unique_ids, on='uni_id', how='left'
+    )
+
+    return selected_uni_ids_df, report
+
 # def extract_top_spatial_selection(selected_uni_ids_df, vehicles_df, top_n=10):
 #     """
 #     Extracts top-N spatially optimized vehicles.
@@ -192,7 +371,8 @@ def extract_top_spatial_selection(selected_uni_ids_df, vehicles_df, top_n=10, se
 
 # FINAL FUNCTION
 
-def spatial_optimization_pipeline(points_gdf, cbs_gdf, vehicles_df, coverage_threshold=3, top_n=10):
+def spatial_optimization_pipeline(points_gdf, cbs_gdf, vehicles_df, coverage_threshold=3, top_n=10, method='lazy', incidence=None,
+                                  time_budget=60):
     """
     Full pipeline for spatial optimization:
     1. Prepares unique vehicle coverage.
@@ -206,6 +386,16 @@ def spatial_optimization_pipeline(points_gdf, cbs_gdf, vehicles_df, coverage_thr
     - vehicles_df         : GeoDataFrame of vehicles with 'uni_id'.
     - coverage_threshold  : Minimum coverage increase to continue selection.
     - top_n               : Number of top optimized vehicles to select.
+    - method              : 'lazy' (CELF lazy greedy, default), 'greedy' (original full re-scan per step)
+                            or 'exact' (branch and bound for the best top_n set; coverage_threshold is not used).
+                            'lazy' and 'exact' ignore points outside the CBS grid, 'greedy' counts them as one
+                            extra cell, so on feeds with such points their selections can differ from 'greedy'.
+    - incidence           : optional point-in-cell CoverageMatrix from build_vehicle_cell_incidence (built from the
+                            prepare_vehicle_unique_ids points of the same points_gdf and cbs_gdf), reused by the lazy
+                            and exact methods to skip the join. Do not pass the buffered 'crs28922_list' matrix of
+                            prepare_vehicles_with_stats: that is a different objective and gives different selections.
+    - time_budget         : seconds for the exact method (default 60); its report (best/greedy coverage,
+                            upper bound, gap) is stored in df_max_spatial.attrs['coverage_report'].
 
     Returns:
     - optimized_ids       : List of selected vehicle IDs.
@@ -214,15 +404,30 @@ def spatial_optimization_pipeline(points_gdf, cbs_gdf, vehicles_df, coverage_thr
     """
 
     # Step 1: Prepare vehicle coverage
-    vehicle_unique_ids, points_gdf_prepared = prepare_vehicle_unique_ids(points_gdf, cbs_gdf)
+    if incidence is not None and method in ('lazy', 'exact'):
+        points_gdf_prepared = None
+        vehicle_unique_ids = pd.DataFrame(
+            {'unique_id_count': incidence.sizes}, index=pd.Index(incidence.vehicle_ids, name='uni_id')
+        ).sort_values(by='unique_id_count', ascending=False)
+    else:
+        vehicle_unique_ids, points_gdf_prepared = prepare_vehicle_unique_ids(points_gdf, cbs_gdf)
 
     # Step 2: Select vehicles to maximize coverage
-    selected = select_vehicles_for_max_coverage(points_gdf_prepared, vehicle_unique_ids, coverage_threshold)
+    if method == 'lazy':
+        selected = select_vehicles_lazy_greedy(points_gdf_prepared, vehicle_unique_ids, coverage_threshold, coverage=incidence)
+    elif method == 'greedy':
+        selected = select_vehicles_for_max_coverage(points_gdf_prepared, vehicle_unique_ids, coverage_threshold)
+    elif method == 'exact':
+        selected, report = select_vehicles_exact(points_gdf_prepared, vehicle_unique_ids, top_n, time_budget, coverage=incidence)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'lazy', 'greedy' or 'exact'")
 
     # Step 3: Extract top-N optimized vehicles
     optimized_ids, filtered_vehicles = extract_top_spatial_selection(selected, vehicles_df, top_n=top_n)
 
     # Step 4: Format selected IDs into a one-column DataFrame
     df_max_spatial = pd.DataFrame({'max_spatial': optimized_ids})
+    if method == 'exact':
+        df_max_spatial.attrs['coverage_report'] = report
 
     return optimized_ids, filtered_vehicles, df_max_spatial
@@ -1,62 +1,129 @@
+import heapq
+import numpy as np
 import geopandas as gpd
 import pandas as pd
+from .coverage_matrix import CoverageMatrix, parse_cell_list
+
+def coverage_order(matrix, avg_count, first_pick):
+    """
+    Incremental ordering engine behind order_vehicles_by_coverage.
+
+    For every candidate v, |S_v sym_diff U| = |S_v| + |U| - 2 |S_v & U|. Only |S_v & U| changes
+    as the union U grows, and only for vehicles that contain a newly added cell (a CSC column
+    lookup), so candidates sit in a heap keyed by (|S_v| - 2 |S_v & U|, -avg_count, row)
+    and are refreshed lazily. Vehicles with a zero difference are set aside until U grows.
+    A chosen vehicle brings all vehicles with the same cell set, sorted by avg_count.
+
+    Parameters:
+    - matrix     : scipy CSR vehicle x cell incidence (rows = vehicles in frame order)
+    - avg_count  : np.ndarray of avg_count_per_crs28992 per row (tie-break, higher first)
+    - first_pick : row of the first vehicle
+
+    Returns:
+    - list of row positions in selection order
+    """
+    n = matrix.shape[0]
+    avg_count = np.asarray(avg_count, dtype=float)
+    csr = matrix.tocsr()
+    csr.sort_indices()
+    csc = csr.tocsc()
+    sizes = np.diff(csr.indptr)
+
+    # higher avg first, NaN last (as idxmax / sort_values), then frame order
+    avg_key = -np.nan_to_num(avg_count, nan=-np.inf)
+
+    # groups of vehicles with exactly the same cell set, in frame order
+    set_ids = pd.factorize(pd.Series([csr.indices[csr.indptr[r]:csr.indptr[r + 1]].tobytes() for r in range(n)]))[0]
+    order = np.argsort(set_ids, kind='stable')
+    group_bounds = np.flatnonzero(np.diff(set_ids[order])) + 1
+    groups = dict(zip(set_ids[order[np.r_[0, group_bounds]]], np.split(order, group_bounds)))
+
+    in_union = np.zeros(csr.shape[1], dtype=bool)
+    inter = np.zeros(n, dtype=np.int64)
+    done = np.zeros(n, dtype=bool)
+    union_size = 0
+    ordered = []
+
+    def add_group(row):
+        nonlocal union_size
+        members = groups[set_ids[row]]
+        members = members[~done[members]]
+        if len(members) > 1:
+            # same call as sorting the duplicates' rows, so ties in avg keep pandas' order
+            by_avg = pd.Series(avg_count[members]).sort_values(ascending=False)
+            members = members[by_avg.index.to_numpy()]
+        done[members] = True
+        ordered.extend(members.tolist())
+
+        new_cells = csr.indices[csr.indptr[row]:csr.indptr[row + 1]]
+        new_cells = new_cells[~in_union[new_cells]]
+        in_union[new_cells] = True
+        union_size += len(new_cells)
+
+        touched = np.concatenate([csc.indices[csc.indptr[c]:csc.indptr[c + 1]] for c in new_cells]) \
+            if len(new_cells) else np.empty(0, dtype=np.int64)
+        touched, hits = np.unique(touched, return_counts=True)
+        inter[touched] += hits
+        return touched[~done[touched]]
+
+    # 1. First pick and its exact duplicates
+    add_group(first_pick)
+    heap = [(sizes[r] - 2 * inter[r], avg_key[r], r) for r in range(n) if not done[r]]
+    heapq.heapify(heap)
+
+    # 2. Repeatedly take the smallest non-zero symmetric difference
+    while len(ordered) < n:
+        deferred = []
+        seed = None
+        while heap:
+            key, avg, row = heapq.heappop(heap)
+            if done[row] or key != sizes[row] - 2 * inter[row]:
+                continue  # already ordered, or a stale key
+            if key + union_size == 0:
+                deferred.append((key, avg, row))  # same set as the union: not a candidate yet
+                continue
+            seed = row
+            break
+        if seed is None:
+            # only vehicles equal to the union are left; take them by avg
+            seed = min(deferred, key=lambda entry: entry[1:])[2]
+
+        for row in add_group(seed):
+            heapq.heappush(heap, (sizes[row] - 2 * inter[row], avg_key[row], row))
+        for entry in deferred:
+            if not done[entry[2]]:
+                heapq.heappush(heap, entry)
+
+    return ordered
+
 
 # Updated function: orders duplicates by avg_count_per_crs28992 when symmetric difference ties
 
-def order_vehicles_by_coverage(gdf_vehicles):
+def order_vehicles_by_coverage(gdf_vehicles, coverage=None):
     """
     Orders vehicles by:
-      1. Highest avg_count_per_crs28992 and its exact duplicates (sorted by avg_count).
-      2. Iteratively adds vehicles by least symmetric difference from union set; 
-         for ties (e.g., difference = 0), orders duplicates by avg_count_per_crs28992.
+      1. Highest count and its exact duplicates (sorted by avg_count_per_crs28992).
+      2. Iteratively adds vehicles by least (non-zero) symmetric difference from union set; 
+         for ties, the highest avg_count_per_crs28992 seeds and its exact duplicates follow by avg_count_per_crs28992.
+
+    The selection runs on the vehicle x cell incidence matrix (coverage_order), so the whole fleet
+    is ordered without recomputing set differences. If a CoverageMatrix is given, cell sets are
+    taken from it instead of parsing 'crs28922_list'.
     """
 
-    gdf = gdf_vehicles.copy()
-    
-    # Ensure list column is a Python list and compute set
-    gdf['crs28922_list'] = gdf['crs28922_list'].apply(
-        lambda x: x if isinstance(x, list) else eval(x)
-    )
-    gdf['crs_set'] = gdf['crs28922_list'].apply(set)
-    
-    ordered_ids = []
-    union_set = set()
-    
-    # 1. First pick: highest avg_count_per_crs28992
-    # and sort its exact duplicates by avg_count_per_crs28992 descending
-    #first_row = gdf.loc[gdf['avg_count_per_crs28992'].idxmax()]
-    first_row = gdf.loc[gdf['count'].idxmax()]
-    first_uid, first_set = first_row['uni_id'], first_row['crs_set']
-    dups = (
-        gdf[gdf['crs_set'] == first_set]
-        .sort_values('avg_count_per_crs28992', ascending=False)
-    )
-    ordered_ids.extend(dups['uni_id'].tolist())
-    union_set |= first_set
-    
-    # 2. Iteratively pick remaining vehicles
-    while len(ordered_ids) < len(gdf):
-        remaining = gdf[~gdf['uni_id'].isin(ordered_ids)].copy()
-        remaining['difference'] = remaining['crs_set'].apply(
-            lambda s: len(s.symmetric_difference(union_set))
-        )
-        # find minimal non-zero difference
-        min_diff = remaining[remaining['difference'] > 0]['difference'].min()
-        # select candidates with that difference
-        candidates = remaining[remaining['difference'] == min_diff]
-        # pick the one with highest avg_count_per_crs28992 to seed
-        seed = candidates.loc[candidates['avg_count_per_crs28992'].idxmax()]
-        seed_set = seed['crs_set']
-        # group exact duplicates and sort by avg_count_per_crs28992
-        group = (
-            remaining[remaining['crs_set'] == seed_set]
-            .sort_values('avg_count_per_crs28992', ascending=False)
-        )
-        ordered_ids.extend(group['uni_id'].tolist())
-        union_set |= seed_set
+    gdf = gdf_vehicles.copy().reset_index(drop=True)
     
+    # Ensure list column is a Python list and build the incidence matrix in frame order
+    gdf['crs28922_list'] = gdf['crs28922_list'].apply(parse_cell_list)
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(gdf)
+    matrix = coverage.aligned(gdf['uni_id'])  # vehicles unknown to the coverage: empty set
+
+    first_pick = int(gdf['count'].idxmax())
+    ordered_rows = coverage_order(matrix, gdf['avg_count_per_crs28992'].to_numpy(), first_pick)
+
     # 3. Build ordered GeoDataFrame (preserves order)
-    ordered_gdf = gdf.set_index('uni_id').loc[ordered_ids].reset_index()
+    ordered_gdf = gdf.iloc[ordered_rows].reset_index(drop=True)
     
     # Select desired columns
     return ordered_gdf[[
@@ -89,13 +156,14 @@ def extract_top_temporal_selection(ordered_vehicles, top_n=10):
 
 # FINAL FUNCTION
 
-def temporal_optimization_pipeline(gdf_vehicles, top_n=10):
+def temporal_optimization_pipeline(gdf_vehicles, top_n=10, coverage=None):
     """
     Runs full temporal optimization pipeline.
 
     Inputs:
     - gdf_vehicles: GeoDataFrame of vehicles
     - top_n: number of top temporal vehicles to select
+    - coverage: optional CoverageMatrix of the vehicles (see prepare_vehicles_with_stats)
 
     Returns:
     - optimized_ids: list of top N selected uni_ids
@@ -103,7 +171,7 @@ def temporal_optimization_pipeline(gdf_vehicles, top_n=10):
     - df_max_temporal: DataFrame with one column 'max_temporal'
     """
     # Step 1: full vehicle ordering
-    ordered_vehicles = order_vehicles_by_coverage(gdf_vehicles)
+    ordered_vehicles = order_vehicles_by_coverage(gdf_vehicles, coverage=coverage)
 
     # Step 2: extract top N
     optimized_ids, top_vehicles = extract_top_temporal_selection(ordered_vehicles, top_n=top_n)
@@ -13,40 +13,33 @@ from matplotlib.colors import LinearSegmentedColormap  # Ensure this line is inc
 import mapclassify
 import matplotlib.pyplot as plt
 from matplotlib.ticker import AutoMinorLocator
+from .coverage_matrix import CoverageMatrix
 
 # Data Analysis Vehicles
 # --------------------------------------------------
 
 
-def get_joined_cbs_gdf(vehicles_gdf, cbs_gdf, vehicle_crs_col='crs28922_list', cbs_crs_col='crs28992'):
+def get_joined_cbs_gdf(vehicles_gdf, cbs_gdf, vehicle_crs_col='crs28922_list', cbs_crs_col='crs28992', coverage=None):
     """
     Loads data and returns joined CBS GeoDataFrame based on CRS cell matches.
 
     Parameters:
-    - vehicles_csv_path : path to vehicles summary CSV
-    - cbs_shp_path      : path to CBS shapefile
+    - vehicles_gdf      : GeoDataFrame of vehicles with 'uni_id' and the CRS-list column
+    - cbs_gdf           : CBS GeoDataFrame
     - vehicle_crs_col   : column name in vehicles_gdf holding CRS-list
     - cbs_crs_col       : column name in cbs_gdf holding the CRS code
+    - coverage          : optional CoverageMatrix; built from vehicles_gdf if None
 
     Returns:
     - GeoDataFrame of filtered CBS cells
     """
-    def extract_unique_crs_codes(df, column):
-        unique_cells = set()
-        for val in df[column]:
-            if isinstance(val, list):
-                unique_cells.update(val)
-            else:
-                inner = val.strip("[]")
-                parts = inner.split("', '")
-                parts = [p.strip(" '\"") for p in parts if p.strip(" '\"")]
-                unique_cells.update(parts)
-        return list(unique_cells)
-
-  
-    # Extract codes and filter
-    codes = extract_unique_crs_codes(vehicles_gdf, column=vehicle_crs_col)
-    return cbs_gdf[cbs_gdf[cbs_crs_col].isin(codes)].copy()
+    if coverage is None:
+        coverage = CoverageMatrix.from_vehicles(vehicles_gdf, list_col=vehicle_crs_col)
+
+    # Rows of the vehicles and the CBS cells they cover
+    rows = coverage.rows(vehicles_gdf['uni_id'])
+    cbs_cols = coverage.cbs_columns(cbs_gdf, cbs_crs_col)
+    return cbs_gdf[coverage.covered_cbs_rows(rows, cbs_cols)].copy()
 
 # vehicle_VIZ_stats_exports.py
 
@@ -600,13 +593,14 @@ def plot_pie_charts(average_stats, filename=None):
 # FINAL FUNCTION 
 
 
-def master_function_analysis(gpd_vehicles, cbs_gdf, buffer_distance, line_number=None, transport_type=None, crs='EPSG:28992'):
+def master_function_analysis(gpd_vehicles, cbs_gdf, buffer_distance, line_number=None, transport_type=None, crs='EPSG:28992', coverage=None):
     """
     Master function to handle the entire process from reading data to generating comparison statistics.
+    Pass the CoverageMatrix from prepare_vehicles_with_stats as `coverage` to skip re-parsing the cell lists.
 
     """
     # Step 4: Perform spatial join
-    joined_gdf = get_joined_cbs_gdf(gpd_vehicles, cbs_gdf)
+    joined_gdf = get_joined_cbs_gdf(gpd_vehicles, cbs_gdf, coverage=coverage)
     
     # Step 5: Generate summary statistics
     stats_ams = generate_summary_statistics(cbs_gdf)
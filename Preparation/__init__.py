@@ -1,8 +1,11 @@
+from .stage_cache import StageCache # optional content-addressed cache for the stages below
 from .cbs_data_cleanup import process_cbs_data # first process CBS data
 from .clean_filter_cbs_city_stats import final_cbs_pipeline, compute_city_stats # second process CBS data, # get city statistics 
+from .cbs_city_batch import process_cities_cbs # CBS preparation and city stats for many cities (one national read, process pool)
 from .merge_interpolate_gtfs_static_realtime import process_gtfs_pipeline # merge interpolate static and realtime 
 from .create_public_lines import extract_public_lines # create public lines from GTFS data
 from .snap_points_to_lines import snap_interpolated_points_to_routes # snap points to lines / routes
 from .analysis_viz_lines_stats_cbs_sensed import lines_analysis, lines_visualisation, line_statistics_pipeline # analysis and visualisation of lines, average lines
 from .fairest_lines_analysis_viz import migration_fairness_lines, all_fairness_lines # migration fairness lines, all fairness lines
-from .intersection_points_cbs_frequency import process_realtime_with_cbs # group by points with CBS data # get frequency of points in CBS data
\ No newline at end of file
+from .intersection_points_cbs_frequency import process_realtime_with_cbs # group by points with CBS data # get frequency of points in CBS data
+from .intersection_points_cbs_frequency import write_grouped_points_parquet # store grouped points as GeoParquet (list<int> cells, categoricals)
\ No newline at end of file
@@ -639,7 +639,7 @@ def inhabitants_by_route(gdf_all, cbs_gdf, buffer_distance=50, crs='EPSG:28992')
     return inhabitants_line
 
 
-def prepare_lines_average(lines_stats_df, city_stats_df, inhabitants_line, total_inhab = 870375): # for Amsterdam
+def prepare_lines_average(lines_stats_df, city_stats_df, inhabitants_line, total_inhab = None): # inhabitants of the city
     # concatenate and reorder
     df = pd.concat([lines_stats_df, city_stats_df], ignore_index=True)
     cols = ['route_shor'] + [c for c in df.columns if c not in ('route_shor','Area')] + ['Area']
@@ -655,6 +655,10 @@ def prepare_lines_average(lines_stats_df, city_stats_df, inhabitants_line, total
 
     # change first row route_shor == "AMSTERDAM"
     df.loc[0, 'route_shor'] = ''
+    if total_inhab is None:
+        if 'A_inhab' not in city_stats_df.columns:
+            raise ValueError("total_inhab is required when city_stats_df has no 'A_inhab' column")
+        total_inhab = city_stats_df['A_inhab'].iloc[0]
     df.loc[0, 'A_Inhab'] = total_inhab
 
 
@@ -738,7 +742,7 @@ def lines_visualisation(gdf_projected, cbs_gdf, joined_gdf, ams_gdf, sums_df, av
 
 # FINAL FUNCTION 3 LINES AVERAGE 
 
-def line_statistics_pipeline(gdf_projected, transport_gdf, cbs_gdf, buffer_distance=50, crs='EPSG:28992'):
+def line_statistics_pipeline(gdf_projected, transport_gdf, cbs_gdf, buffer_distance=50, crs='EPSG:28992', area_name='Amsterdam'):
     """
     Full pipeline to process line statistics:
     1. Aggregate line statistics.
@@ -752,6 +756,8 @@ def line_statistics_pipeline(gdf_projected, transport_gdf, cbs_gdf, buffer_dista
     - cbs_filepath : path to CBS shapefile
     - buffer_distance : buffer size (default 50)
     - crs : coordinate reference system (default EPSG:28992)
+    - area_name : name of the city row (default 'Amsterdam'); that row's A_inhab, the sum over cbs_gdf,
+                  is the city population passed to prepare_lines_average (no fixed 870375 default)
 
     Returns:
     - lines_stats : final prepared average line statistics DataFrame
@@ -767,7 +773,8 @@ def line_statistics_pipeline(gdf_projected, transport_gdf, cbs_gdf, buffer_dista
     )
 
     # Step 3: Calculate city-level stats
-    average_stats = normalize_statistics(generate_summary_statistics(cbs_gdf))
+    summary_stats = generate_summary_statistics(cbs_gdf, area_name=area_name)
+    average_stats = normalize_statistics(summary_stats)
     city_stats_df = average_stats.loc[average_stats.index == 0]
 
     # Step 4: Calculate inhabitants per line
@@ -782,7 +789,8 @@ def line_statistics_pipeline(gdf_projected, transport_gdf, cbs_gdf, buffer_dista
     lines_stats = prepare_lines_average(
         lines_stats_df,
         city_stats_df,
-        inhabitants_line
+        inhabitants_line,
+        total_inhab=summary_stats['A_inhab'].iloc[0]
     )
 
     return lines_stats
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# CBS grid ids look like 'E1213N4871': easting and northing of the lower-left corner in hectometres (RD New),
+# always four digits each. Codes pack them into one int64 as (easting << 16) | northing, which also fits an
+# int32 for the Netherlands. Only this canonical form is encoded, so every code decodes back to its id;
+# anything else ('E01213N4871', 'E12N34', missing values) becomes -1.
+CELL_ID_PATTERN = r'^E(\d{4})N(\d{4})$'
+NORTHING_BITS = 16
+NORTHING_MASK = (1 << NORTHING_BITS) - 1
+
+
+def fixed_width_codes(strings: np.ndarray) -> np.ndarray:
+    """
+    Codes of canonical 'E####N####' ids (CELL_ID_PATTERN, ASCII digits) from their characters,
+    without regex; -1 for every other string.
+    """
+    codes = np.full(len(strings), -1, dtype=np.int64)
+    width = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    candidates = np.flatnonzero(width == 10)
+    if len(candidates) == 0:
+        return codes
+
+    chars = strings[candidates].astype('U10').view(np.uint32).reshape(-1, 10).astype(np.int64)
+    digits = chars[:, [1, 2, 3, 4, 6, 7, 8, 9]] - ord('0')
+    ok = (chars[:, 0] == ord('E')) & (chars[:, 5] == ord('N')) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    place = np.array([1000, 100, 10, 1])
+    easting, northing = digits[ok, :4] @ place, digits[ok, 4:] @ place
+    codes[candidates[ok]] = (easting << NORTHING_BITS) | northing
+    return codes
+
+
+def encode_cell_ids(cell_ids) -> np.ndarray:
+    """
+    Encode CBS cell ids ('E1213N4871') into int64 codes.
+
+    Parameters:
+    - cell_ids : array-like of cell id strings (integer codes are passed through)
+
+    Returns:
+    - np.ndarray of int64 codes, -1 for missing or non-canonical ids (see CELL_ID_PATTERN)
+    """
+    values = cell_ids if isinstance(cell_ids, pd.Series) else pd.Series(cell_ids)
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+
+    # parse each distinct id only once; point data repeats the same cells many times
+    positions, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    unique_codes = np.full(len(uniques), -1, dtype=np.int64)
+
+    if pd.api.types.infer_dtype(uniques, skipna=False) == 'string':
+        is_int = np.zeros(len(uniques), dtype=bool)
+    else:
+        is_int = uniques.map(lambda v: isinstance(v, (int, np.integer))).to_numpy(dtype=bool)
+    unique_codes[is_int] = uniques[is_int].astype(np.int64).to_numpy()
+
+    text = np.flatnonzero(~is_int)
+    strings = uniques[~is_int].astype(str).to_numpy(dtype=object)
+    unique_codes[text] = fixed_width_codes(strings)
+
+    codes = np.full(len(values), -1, dtype=np.int64)
+    codes[positions >= 0] = unique_codes[positions[positions >= 0]]
+    return codes
+
+
+def decode_cell_ids(codes) -> np.ndarray:
+    """
+    Decode int64 codes back into CBS cell id strings (None for -1).
+
+    Parameters:
+    - codes : array-like of codes from encode_cell_ids
+
+    Returns:
+    - np.ndarray (object) of 'E####N####' strings
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array([
+        f"E{code >> NORTHING_BITS:04d}N{code & NORTHING_MASK:04d}" if code >= 0 else None
+        for code in uniques.tolist()
+    ], dtype=object)
+    return labels[inverse.reshape(-1)]
+
+
+def cell_ids_from_xy(x, y, cell_size: int = 100) -> np.ndarray:
+    """
+    Codes of the grid cells containing RD New coordinates (EPSG:28992, metres).
+
+    Parameters:
+    - x, y      : array-like coordinates in metres
+    - cell_size : grid resolution in metres (default 100)
+
+    Returns:
+    - np.ndarray of int64 codes
+    """
+    step = cell_size // 100
+    easting = np.floor(np.asarray(x, dtype=float) / cell_size).astype(np.int64) * step
+    northing = np.floor(np.asarray(y, dtype=float) / cell_size).astype(np.int64) * step
+    return (easting << NORTHING_BITS) | northing
+
+
+def cell_origin(codes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lower-left corner (x, y) in metres of the cells behind the given codes.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    return (codes >> NORTHING_BITS) * 100, (codes & NORTHING_MASK) * 100
+
+
+def parse_cell_list(val):
+    """
+    Parses one 'crs28922_list' / 'crs28992_list' entry into a list of CBS cell codes.
+    Accepts Python lists, numpy arrays and stringified lists ("['E1213N4871', ...]").
+    Missing values give an empty list.
+    """
+    if isinstance(val, (list, tuple, set, np.ndarray)):
+        return list(val)
+    if isinstance(val, str):
+        parts = [p.strip(" '\"") for p in val.strip().strip("[]").split(",")]
+        return [p for p in parts if p]
+    return []
+
+
+def encode_cell_lists(cell_lists) -> pd.Series:
+    """
+    Encode a column of cell id lists (lists, arrays or stringified lists) into int64 code arrays,
+    e.g. for a native list<int64> Parquet column. All ids are encoded in one pass.
+
+    Returns:
+    - pd.Series (same index) of np.ndarray int64 codes
+    """
+    cell_lists = cell_lists.map(parse_cell_list)
+    offsets = np.cumsum([0] + [len(cells) for cells in cell_lists])
+    codes = encode_cell_ids(pd.Series([c for cells in cell_lists for c in cells], dtype=object))
+    return pd.Series([codes[a:b] for a, b in zip(offsets[:-1], offsets[1:])], index=cell_lists.index, dtype=object)
+
+
+def decode_cell_lists(code_lists) -> pd.Series:
+    """
+    Decode a column of int64 code arrays (encode_cell_lists, list<int64> Parquet) into tuples
+    of 'E####N####' ids. All codes are decoded in one pass.
+
+    Returns:
+    - pd.Series (same index) of tuples of cell id strings
+    """
+    arrays = [np.asarray(codes if isinstance(codes, np.ndarray) else parse_cell_list(codes), dtype=np.int64)
+              for codes in code_lists]
+    offsets = np.cumsum([0] + [len(codes) for codes in arrays])
+    labels = decode_cell_ids(np.concatenate(arrays) if arrays else [])
+    return pd.Series([tuple(labels[a:b]) for a, b in zip(offsets[:-1], offsets[1:])], index=code_lists.index, dtype=object)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor
+from .cbs_data_cleanup import clip_and_filter_cbs_by_municipalities, clean_cbs_nan, rename_and_recalculate
+from .clean_filter_cbs_city_stats import final_cbs_pipeline, compute_city_stats
+
+
+def read_cbs_grid(cbs) -> gpd.GeoDataFrame:
+    """
+    The national CBS grid: a GeoDataFrame is passed through, a path is read once
+    (GeoParquet with read_parquet, anything else, e.g. data/cbs_vk100_2021_vol.gpkg, with read_file).
+    """
+    if isinstance(cbs, gpd.GeoDataFrame):
+        return cbs
+    if str(cbs).endswith('.parquet'):
+        return gpd.read_parquet(cbs)
+    return gpd.read_file(cbs)
+
+
+def process_city_cbs(task):
+    """
+    Cleanup, WOZ imputation, negative-value repair and city stats for one city
+    (process_cbs_data steps 2-3, final_cbs_pipeline, compute_city_stats). Runs in a worker process.
+
+    Parameters:
+    - task : tuple (name, cbs_city, adjust_method, negative_method, seed, return_cbs) with cbs_city the
+             clipped CBS cells of the city (clip_and_filter_cbs_by_municipalities)
+
+    Returns:
+    - name, full_cbs (None unless return_cbs), one-row city stats DataFrame
+    """
+    name, cbs_city, adjust_method, negative_method, seed, return_cbs = task
+    _, cleaned = clean_cbs_nan(cbs_city)
+    semi_cbs = rename_and_recalculate(cleaned)
+    full_cbs = final_cbs_pipeline(semi_cbs, adjust_method=adjust_method, negative_method=negative_method, seed=seed)
+    stats = compute_city_stats(full_cbs, area_name=name)
+    return name, full_cbs if return_cbs else None, stats
+
+
+# FINAL FUNCTION
+
+def process_cities_cbs(cbs, municipalities: gpd.GeoDataFrame, name_col: str = None, n_jobs: int = 1,
+                       adjust_method: str = 'multinomial', negative_method: str = 'multinomial', seed=None,
+                       return_cbs: bool = False):
+    """
+    CBS preparation and city stats for many cities at once.
+
+    The national grid is read once and partitioned by municipality with a single spatial index
+    (clip_and_filter_cbs_by_municipalities); every city is then cleaned and summarized independently,
+    on n_jobs worker processes. Each city gets its own seed spawned from `seed`, so the output does not
+    depend on n_jobs or on the order in which the workers finish.
+    With n_jobs > 1, scripts must call this under `if __name__ == '__main__':` (process pool).
+
+    Parameters:
+    - cbs             : national CBS grid GeoDataFrame, or its path (read once)
+    - municipalities  : GeoDataFrame of city boundaries (e.g. CBS gemeentegrenzen)
+    - name_col        : column with the city name; the index is used if None
+    - n_jobs          : number of worker processes (default 1 = no pool)
+    - adjust_method   : passed to final_cbs_pipeline ('multinomial' or 'largest_remainder')
+    - negative_method : passed to final_cbs_pipeline ('multinomial' or 'proportional')
+    - seed            : random seed for the multinomial steps
+    - return_cbs      : also return the analysis-ready CBS grid of every city (default False)
+
+    Returns:
+    - city_stats : DataFrame with one compute_city_stats row per city ('Area' = city name)
+    - full_cbs   : dict name -> cleaned CBS GeoDataFrame (only if return_cbs)
+    """
+    cbs = read_cbs_grid(cbs)
+    cities = clip_and_filter_cbs_by_municipalities(cbs, municipalities, name_col=name_col)
+    seeds = np.random.SeedSequence(seed).spawn(len(cities))
+
+    tasks = [(name, cbs_city, adjust_method, negative_method, city_seed, return_cbs)
+             for (name, cbs_city), city_seed in zip(cities.items(), seeds)]
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(process_city_cbs, tasks))
+    else:
+        results = [process_city_cbs(task) for task in tasks]
+
+    city_stats = pd.concat([stats for _, _, stats in results], ignore_index=True)
+    if return_cbs:
+        return city_stats, {name: full_cbs for name, full_cbs, _ in results}
+    return city_stats
@@ -1,30 +1,119 @@
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import shapely
+from .cbs_cell_codec import encode_cell_ids, cell_origin
 
+CBS_COLUMNS = [
+    'crs28992res100m',
+    'aantal_inwoners',
+    'aantal_inwoners_0_tot_15_jaar',
+    'aantal_inwoners_15_tot_25_jaar',
+    'aantal_inwoners_25_tot_45_jaar',
+    'aantal_inwoners_45_tot_65_jaar',
+    'aantal_inwoners_65_jaar_en_ouder',
+    'percentage_nederlandse_achtergrond',
+    'percentage_westerse_migr_achtergr',
+    'percentage_niet_westerse_migr_achtergr',
+    'aantal_woningen',
+    'gemiddelde_woz_waarde_woning',
+    'geometry'
+]
+CLIP_METHODS = ('overlay', 'index')
+CELL_SIZE = 100
 
-def clip_and_filter_cbs_by_city(cbs: gpd.GeoDataFrame, city: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    cbs = cbs.to_crs(epsg=28992)
-    city = city.to_crs(epsg=28992)
-    clipped = gpd.overlay(cbs, city, how='intersection')
-    unique_vals = clipped['crs28992res100m'].unique()
+
+def to_rd(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """The frame in RD New (EPSG:28992); frames already in RD New are returned as they are."""
+    return gdf if gdf.crs is not None and gdf.crs.to_epsg() == 28992 else gdf.to_crs(epsg=28992)
+
+
+def match_cells_to_areas(cbs: gpd.GeoDataFrame, areas: gpd.GeoDataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs of (area row, CBS row) whose geometries share interior, i.e. a cell belongs to an area
+    when their intersection has an area, as with gpd.overlay(how='intersection').
+
+    Cells are first pre-filtered on the areas' bounding box with the grid coordinates packed in
+    'crs28992res100m' (no geometry needed), the rest goes into one STRtree that is queried with
+    all area geometries at once ('intersects'); pairs that only touch are dropped.
+
+    Parameters:
+    - cbs   : CBS GeoDataFrame in RD New with 'crs28992res100m'
+    - areas : GeoDataFrame of areas (e.g. municipalities) in RD New
+
+    Returns:
+    - area_rows, cbs_rows : int arrays of row positions
+    """
+    codes = encode_cell_ids(cbs['crs28992res100m'])
+    x, y = cell_origin(codes)
+    minx, miny, maxx, maxy = areas.total_bounds
+    in_bounds = (x + CELL_SIZE >= minx) & (x <= maxx) & (y + CELL_SIZE >= miny) & (y <= maxy)
+    candidates = np.flatnonzero(in_bounds | (codes < 0))  # unknown ids are checked on geometry only
+
+    cells = cbs.geometry.to_numpy()[candidates]
+    area_geoms = areas.geometry.to_numpy()
+    shapely.prepare(area_geoms)
+
+    area_rows, cell_rows = shapely.STRtree(cells).query(area_geoms, predicate='intersects')
+    keep = ~shapely.touches(area_geoms[area_rows], cells[cell_rows])
+    return area_rows[keep], candidates[cell_rows[keep]]
+
+
+def clip_and_filter_cbs_by_city(cbs: gpd.GeoDataFrame, city: gpd.GeoDataFrame, method: str = 'overlay') -> gpd.GeoDataFrame:
+    """
+    CBS cells (CBS_COLUMNS) that intersect the city.
+
+    Parameters:
+    - cbs    : national CBS grid GeoDataFrame
+    - city   : GeoDataFrame of the city boundary
+    - method : 'overlay' (default, exact gpd.overlay intersection) or 'index' (bounding box pre-filter on
+               the cell ids and an STRtree query, see match_cells_to_areas; same cells, much faster on
+               the national grid)
+
+    Returns:
+    - filtered CBS GeoDataFrame in RD New
+    """
+    if method not in CLIP_METHODS:
+        raise ValueError(f"Unknown method '{method}'. Choose from {CLIP_METHODS}.")
+
+    if method == 'index':
+        cbs, city = to_rd(cbs), to_rd(city)
+        _, cbs_rows = match_cells_to_areas(cbs, city)
+        unique_vals = cbs['crs28992res100m'].iloc[cbs_rows].unique()
+    else:
+        cbs = cbs.to_crs(epsg=28992)
+        city = city.to_crs(epsg=28992)
+        clipped = gpd.overlay(cbs, city, how='intersection')
+        unique_vals = clipped['crs28992res100m'].unique()
     filtered = cbs[cbs['crs28992res100m'].isin(unique_vals)].copy()
 
-    return filtered[[
-        'crs28992res100m',
-        'aantal_inwoners',
-        'aantal_inwoners_0_tot_15_jaar',
-        'aantal_inwoners_15_tot_25_jaar',
-        'aantal_inwoners_25_tot_45_jaar',
-        'aantal_inwoners_45_tot_65_jaar',
-        'aantal_inwoners_65_jaar_en_ouder',
-        'percentage_nederlandse_achtergrond',
-        'percentage_westerse_migr_achtergr',
-        'percentage_niet_westerse_migr_achtergr',
-        'aantal_woningen',
-        'gemiddelde_woz_waarde_woning',
-        'geometry'
-    ]]
+    return filtered[CBS_COLUMNS]
+
+
+def clip_and_filter_cbs_by_municipalities(cbs: gpd.GeoDataFrame, municipalities: gpd.GeoDataFrame,
+                                          name_col: str = None) -> dict:
+    """
+    CBS cells (CBS_COLUMNS) per municipality, for many municipalities in one pass:
+    one bounding box pre-filter and one STRtree over the national grid (match_cells_to_areas).
+    A cell on a municipal border belongs to every municipality it intersects.
+
+    Parameters:
+    - cbs            : national CBS grid GeoDataFrame
+    - municipalities : GeoDataFrame with one or more rows per municipality
+    - name_col       : column with the municipality name; the index is used if None.
+                       Rows with the same name are combined.
+
+    Returns:
+    - dict name -> filtered CBS GeoDataFrame in RD New (names without cells are left out)
+    """
+    cbs, municipalities = to_rd(cbs), to_rd(municipalities)
+    names = municipalities.index.to_numpy() if name_col is None else municipalities[name_col].to_numpy()
+
+    area_rows, cbs_rows = match_cells_to_areas(cbs, municipalities)
+    pairs = pd.Series(cbs_rows).groupby(names[area_rows], sort=False)
+
+    # only the rows each municipality matched, never a scan of the national grid per municipality
+    return {name: cbs.iloc[np.unique(rows.to_numpy())][CBS_COLUMNS].copy() for name, rows in pairs}
 
 def clean_cbs_nan(gdf: gpd.GeoDataFrame) -> tuple[pd.DataFrame, gpd.GeoDataFrame]:
     nan_counts = (gdf == -99997).sum()
@@ -56,9 +145,10 @@ def rename_and_recalculate(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 
 # FINAL FUNCTION 
 
-def process_cbs_data(cbs: gpd.GeoDataFrame, city: gpd.GeoDataFrame) -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
+def process_cbs_data(cbs: gpd.GeoDataFrame, city: gpd.GeoDataFrame, method: str = 'overlay') -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
     """
     1. clip_and_filter_cbs_by_city: clip CBS data to city boundary and select relevant columns  
+       (method 'overlay' or the faster spatial index selection 'index')  
     2. clean_cbs_nan: replace -99997 with NaN and drop rows with NaN in 'aantal_inwoners'  
     3. rename_and_recalculate: rename columns and recalculate A_nederlan, A_west_mig, A_n_west_mig  
 
@@ -66,7 +156,7 @@ def process_cbs_data(cbs: gpd.GeoDataFrame, city: gpd.GeoDataFrame) -> tuple[gpd
     - Cleaned CBS GeoDataFrame
     - NaN summary DataFrame
     """
-    filtered = clip_and_filter_cbs_by_city(cbs, city)
+    filtered = clip_and_filter_cbs_by_city(cbs, city, method=method)
     nan_summary, cleaned = clean_cbs_nan(filtered)
     semi_cbs = rename_and_recalculate(cleaned)
     return semi_cbs, nan_summary
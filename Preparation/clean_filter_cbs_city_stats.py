@@ -1,11 +1,66 @@
 # import libraries
 import geopandas as gpd
 import numpy as np
-import random
 from sklearn.linear_model import LinearRegression
 import pandas as pd
 
-def clean_and_adjust_cbs(cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+ADJUST_METHODS = ('multinomial', 'largest_remainder')
+REPAIR_METHODS = ('multinomial', 'proportional')
+
+
+def reconcile_to_target(values: np.ndarray, target: np.ndarray, method: str = 'multinomial', seed=None) -> np.ndarray:
+    """
+    Integer group counts that sum exactly to the row targets, for all rows at once.
+
+    - 'multinomial'       : values are rounded; a shortfall is added as one multinomial draw with equal
+                            column probabilities (person by person at random, as before), an excess is
+                            removed evenly, the first columns losing one more (can go negative, see
+                            adjust_negative_values)
+    - 'largest_remainder' : proportional apportionment of the unrounded values (negatives count as 0):
+                            quotas value * target / row sum are floored and the leftover persons go to the
+                            largest remainders (ties by column order); rows summing to 0 are split evenly.
+                            Deterministic and never negative.
+
+    Parameters:
+    - values : (n x k) float array of group counts
+    - target : (n,) integer row totals
+    - method : 'multinomial' (default) or 'largest_remainder'
+    - seed   : seed or np.random.Generator for the multinomial draws
+
+    Returns:
+    - (n x k) int64 array with rows summing to target
+    """
+    if method not in ADJUST_METHODS:
+        raise ValueError(f"Unknown method '{method}'. Choose from {ADJUST_METHODS}.")
+    values = np.asarray(values, dtype=float)
+    target = np.asarray(target, dtype=np.int64)
+    n, k = values.shape
+
+    if method == 'largest_remainder':
+        values = np.clip(values, 0, None)
+        row_sum = values.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quota = np.where(row_sum > 0, values * target[:, None] / row_sum, target[:, None] / k)
+        counts = np.floor(quota)
+        leftover = target - counts.sum(axis=1).astype(np.int64)
+        rank = np.argsort(np.argsort(-(quota - counts), axis=1, kind='stable'), axis=1, kind='stable')
+        return counts.astype(np.int64) + (rank < leftover[:, None])
+
+    counts = np.round(values).astype(np.int64)
+    diff = target - counts.sum(axis=1)
+
+    short = diff > 0
+    if short.any():
+        rng = np.random.default_rng(seed)
+        counts[short] += rng.multinomial(diff[short], np.full(k, 1 / k))
+
+    excess = diff < 0
+    base, rem = np.divmod(-diff[excess], k)
+    counts[excess] -= base[:, None] + (np.arange(k) < rem[:, None])
+    return counts
+
+
+def clean_and_adjust_cbs(cbs: gpd.GeoDataFrame, method: str = 'multinomial', seed=None) -> gpd.GeoDataFrame:
     """
     Clean and adjust CBS population data so that age and migration columns
     sum exactly to A_inhab (total inhabitants).
@@ -14,11 +69,14 @@ def clean_and_adjust_cbs(cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     1. Drop irrelevant columns
     2. Fill NaNs and replace inf values
     3. Round to integers
-    4. Adjust group counts to match A_inhab exactly
+    4. Adjust group counts to match A_inhab exactly (reconcile_to_target, all rows at once)
     5. Recalculate and verify sums
 
     Parameters:
-    - cbs : GeoDataFrame with CBS columns
+    - cbs    : GeoDataFrame with CBS columns
+    - method : 'multinomial' (default, random person-by-person fill as before) or
+               'largest_remainder' (deterministic proportional rounding), see reconcile_to_target
+    - seed   : seed or np.random.Generator, makes the 'multinomial' fill reproducible
 
     Returns:
     - Cleaned and corrected GeoDataFrame
@@ -43,30 +101,11 @@ def clean_and_adjust_cbs(cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     cbs[age_cols + mig_cols + ['A_inhab']] = cbs[age_cols + mig_cols + ['A_inhab']].fillna(0)
     cbs = cbs.replace([np.inf, -np.inf], 0)
 
-    # round to whole persons
-    cbs[age_cols + mig_cols] = cbs[age_cols + mig_cols].round(0)
-
-    # adjust totals
-    def adjust_columns_to_target(row, target_col, columns):
-        target = int(row[target_col])
-        for col in columns:
-            row[col] = int(row[col])
-        current_sum = sum(row[col] for col in columns)
-        diff = target - current_sum
-        if diff > 0:
-            while current_sum < target:
-                col = random.choice(columns)
-                row[col] += 1
-                current_sum += 1
-        elif diff < 0:
-            total = -diff
-            base, rem = divmod(total, len(columns))
-            for i, col in enumerate(columns):
-                row[col] -= base + (1 if i < rem else 0)
-        return row
-
-    cbs = cbs.apply(lambda r: adjust_columns_to_target(r, 'A_inhab', age_cols), axis=1)
-    cbs = cbs.apply(lambda r: adjust_columns_to_target(r, 'A_inhab', mig_cols), axis=1)
+    # round to whole persons and adjust totals
+    rng = np.random.default_rng(seed)
+    target = cbs['A_inhab'].to_numpy(dtype=float).astype(np.int64)
+    for cols in (age_cols, mig_cols):
+        cbs[cols] = reconcile_to_target(cbs[cols].to_numpy(dtype=float), target, method=method, seed=rng)
 
     # recompute and enforce integer type
     cbs['age_sum'] = cbs[age_cols].sum(axis=1)
@@ -116,13 +155,60 @@ def impute_woz_with_regression(cbs_full: pd.DataFrame) -> pd.DataFrame:
 
     return cbs_full
 
-def adjust_negative_values(cbs_full: pd.DataFrame) -> pd.DataFrame:
+def repair_negative_counts(values: np.ndarray, method: str = 'multinomial', seed=None) -> np.ndarray:
+    """
+    Clips negative group counts to 0 and takes each row's deficit from its positive columns, for all rows at once.
+    Row totals are preserved exactly (as long as the row total is not negative) and no count drops below 0.
+
+    - 'multinomial'  : the deficit is removed person by person at random (a multivariate hypergeometric draw
+                       over the positive counts, sampled column by column)
+    - 'proportional' : the deficit is removed in proportion to the positive counts, rounded by largest remainder
+                       (deterministic)
+
+    Parameters:
+    - values : (n x k) array of integer group counts
+    - method : 'multinomial' (default) or 'proportional'
+    - seed   : seed or np.random.Generator for the multinomial draws
+
+    Returns:
+    - (n x k) int64 array of non-negative counts
+    """
+    if method not in REPAIR_METHODS:
+        raise ValueError(f"Unknown method '{method}'. Choose from {REPAIR_METHODS}.")
+    values = np.asarray(values, dtype=np.int64)
+    counts = np.clip(values, 0, None)
+    deficit = np.minimum(-np.clip(values, None, 0).sum(axis=1), counts.sum(axis=1))
+    rows = np.flatnonzero(deficit > 0)
+    if len(rows) == 0:
+        return counts
+
+    block, deficit = counts[rows], deficit[rows]
+    if method == 'proportional':
+        counts[rows] = reconcile_to_target(block, block.sum(axis=1) - deficit, method='largest_remainder')
+        return counts
+
+    rng = np.random.default_rng(seed)
+    remaining = block.sum(axis=1)
+    for col in range(block.shape[1] - 1):
+        remaining = remaining - block[:, col]
+        removed = rng.hypergeometric(block[:, col], remaining, deficit)
+        block[:, col] -= removed
+        deficit = deficit - removed
+    block[:, -1] -= deficit
+    counts[rows] = block
+    return counts
+
+
+def adjust_negative_values(cbs_full: pd.DataFrame, method: str = 'multinomial', seed=None) -> pd.DataFrame:
     """
     Detect and correct negative values in age and migration columns while preserving total group sums.
-    Negative values are set to 0 and their deficit is redistributed across the remaining positive columns.
+    Negative values are set to 0 and their deficit is taken from the remaining positive columns
+    (repair_negative_counts, all rows at once).
 
     Parameters:
     - cbs_full : DataFrame with population columns
+    - method   : 'multinomial' (default, random persons) or 'proportional' (deterministic)
+    - seed     : seed or np.random.Generator, makes the 'multinomial' repair reproducible
 
     Returns:
     - Cleaned DataFrame with non-negative age/migration columns and preserved group totals
@@ -132,24 +218,10 @@ def adjust_negative_values(cbs_full: pd.DataFrame) -> pd.DataFrame:
     age_cols = ['A_0_15', 'A_15_25', 'A_25_45', 'A_45_65', 'A_65+']
     mig_cols = ['A_nederlan', 'A_west_mig', 'A_n_west_m']
 
-    def adjust_negatives(row, cols):
-        deficit = sum(-row[col] for col in cols if row[col] < 0)
-        original_sum = sum(row[col] for col in cols)
-        for col in cols:
-            if row[col] < 0:
-                row[col] = 0
-        while deficit > 0:
-            positive_cols = [col for col in cols if row[col] > 0]
-            if not positive_cols:
-                break
-            chosen_col = random.choice(positive_cols)
-            row[chosen_col] -= 1
-            deficit -= 1
-        return row
-
     # Apply to migration and age columns
-    cbs_full = cbs_full.apply(lambda row: adjust_negatives(row, mig_cols), axis=1)
-    cbs_full = cbs_full.apply(lambda row: adjust_negatives(row, age_cols), axis=1)
+    rng = np.random.default_rng(seed)
+    for cols in (mig_cols, age_cols):
+        cbs_full[cols] = repair_negative_counts(cbs_full[cols].to_numpy(), method=method, seed=rng)
 
     # Recompute and verify
     cbs_full['migration_sum'] = cbs_full[mig_cols].sum(axis=1)
@@ -162,24 +234,31 @@ def adjust_negative_values(cbs_full: pd.DataFrame) -> pd.DataFrame:
 
 # FINAL FUNCTION 1 
 
-def final_cbs_pipeline(cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+def final_cbs_pipeline(cbs: gpd.GeoDataFrame, adjust_method: str = 'multinomial', negative_method: str = 'multinomial',
+                       seed=None) -> gpd.GeoDataFrame:
     """
     Pipeline to process CBS data:
     1. Clean and adjust population groups
     2. Impute missing G_woz_woni values
     3. Adjust any remaining negative values
+
+    adjust_method ('multinomial' or 'largest_remainder') is passed to clean_and_adjust_cbs and
+    negative_method ('multinomial' or 'proportional') to adjust_negative_values; both use one
+    generator from seed, so a fixed seed gives the same output on every run.
     """
-    cbs_clean = clean_and_adjust_cbs(cbs)
+    rng = np.random.default_rng(seed)
+    cbs_clean = clean_and_adjust_cbs(cbs, method=adjust_method, seed=rng)
     cbs_imputed = impute_woz_with_regression(cbs_clean)
-    cbs_full = adjust_negative_values(cbs_imputed)
+    cbs_full = adjust_negative_values(cbs_imputed, method=negative_method, seed=rng)
     return cbs_full
 
 # FINAL FUNCTION 2
 
 
-def compute_city_stats(cbs_city):
+def compute_city_stats(cbs_city, area_name='Amsterdam'):
     """
     Compute city-level demographic and housing statistics from CBS data.
+    area_name is written to the 'Area' column (default 'Amsterdam').
 
     Outputs:
     - Total inhabitants
@@ -202,7 +281,7 @@ def compute_city_stats(cbs_city):
     pct_mig = (mig_sums / total_inhab * 100).round(2)
 
     stats = pd.DataFrame([{
-        'Area': 'Amsterdam',
+        'Area': area_name,
         'A_inhab': total_inhab,
         'G_woz_woni': mean_woz,
         **age_sums.to_dict(),
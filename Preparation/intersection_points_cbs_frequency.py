@@ -11,6 +11,7 @@ import shapely
 from sklearn.linear_model import LinearRegression
 from sklearn.impute import SimpleImputer
 from shapely import wkt
+from .cbs_cell_codec import encode_cell_ids, encode_cell_lists, cell_ids_from_xy
 
 def prepare_points_for_join(gdf_cbs: gpd.GeoDataFrame, points_realtime: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
@@ -79,6 +80,73 @@ def spatial_join_intersections(buffer_points: gpd.GeoDataFrame, gdf_cbs: gpd.Geo
     
     return intersected_points
 
+def stencil_join_intersections(points: gpd.GeoDataFrame, gdf_cbs: gpd.GeoDataFrame,
+                               buffer_distance: float = 50, cell_size: int = 100) -> pd.DataFrame:
+    """
+    Grid-stencil alternative to create_buffer + spatial_join_intersections.
+    CBS cells form an axis-aligned grid, so the cells a buffered point intersects follow from
+    floor arithmetic on its RD coordinates plus a point-to-cell distance check on the neighbouring cells.
+    No buffer geometry is built, except for the rare cells grazing the buffer edge: there the
+    polygon buffer and the circle differ, so those pairs are tested exactly against create_buffer's polygon.
+
+    Parameters:
+    - points          : prepared points GeoDataFrame (EPSG:28992, with 'id')
+    - gdf_cbs         : CBS GeoDataFrame with 'crs28992' (one row per grid cell)
+    - buffer_distance : buffer size in meters (default 50)
+    - cell_size       : CBS grid resolution in meters (default 100)
+
+    Returns:
+    - DataFrame with 'id', 'crs28992_list', and 'count_crs28992' (no geometry), as spatial_join_intersections
+      (same cells per point; lists are in CBS row order instead of spatial-index order)
+    """
+    x = points.geometry.x.to_numpy()
+    y = points.geometry.y.to_numpy()
+
+    # candidate cells: the stencil of neighbours that can reach the buffer
+    reach = int(np.ceil(buffer_distance / cell_size))
+    offsets = np.arange(-reach, reach + 1) * cell_size
+    off_x, off_y = [o.ravel() for o in np.meshgrid(offsets, offsets, indexing='ij')]
+    cell_x0 = (np.floor(x / cell_size) * cell_size)[:, None] + off_x[None, :]
+    cell_y0 = (np.floor(y / cell_size) * cell_size)[:, None] + off_y[None, :]
+
+    # distance from each point to each candidate cell (0 inside the cell)
+    dx = np.maximum.reduce([cell_x0 - x[:, None], np.zeros_like(cell_x0), x[:, None] - (cell_x0 + cell_size)])
+    dy = np.maximum.reduce([cell_y0 - y[:, None], np.zeros_like(cell_y0), y[:, None] - (cell_y0 + cell_size)])
+    dist = np.hypot(dx, dy)
+
+    # within the inscribed circle of the buffer polygon (>= 32 segments) -> hit; beyond the radius -> miss;
+    # in between -> exact test against the same polygon create_buffer builds
+    inner = buffer_distance * np.cos(np.pi / 32)
+    point_idx, cand_idx = np.nonzero(dist <= buffer_distance)
+    hit = dist[point_idx, cand_idx] <= inner
+    edge = ~hit
+    if edge.any():
+        buffers = points.geometry.iloc[point_idx[edge]].buffer(buffer_distance).values
+        x0, y0 = cell_x0[point_idx[edge], cand_idx[edge]], cell_y0[point_idx[edge], cand_idx[edge]]
+        hit[edge] = shapely.intersects(buffers, shapely.box(x0, y0, x0 + cell_size, y0 + cell_size))
+    point_idx, cand_idx = point_idx[hit], cand_idx[hit]
+
+    # keep only cells that exist in the CBS grid, in CBS row order per point
+    codes = cell_ids_from_xy(cell_x0[point_idx, cand_idx] + cell_size / 2,
+                             cell_y0[point_idx, cand_idx] + cell_size / 2, cell_size)
+    cbs_codes = encode_cell_ids(gdf_cbs['crs28992'])
+    cbs_rows = np.flatnonzero(cbs_codes >= 0)
+    cbs_pos = pd.Index(cbs_codes[cbs_rows]).get_indexer(codes)
+    cbs_pos = np.where(cbs_pos >= 0, cbs_rows[cbs_pos], -1)
+    point_idx, cbs_pos = point_idx[cbs_pos >= 0], cbs_pos[cbs_pos >= 0]
+    order = np.lexsort((cbs_pos, point_idx))
+    point_idx, cbs_pos = point_idx[order], cbs_pos[order]
+
+    counts = np.bincount(point_idx, minlength=len(points))
+    cell_names = gdf_cbs['crs28992'].to_numpy()[cbs_pos]
+    crs_lists = np.split(cell_names, np.cumsum(counts)[:-1]) if len(points) else []
+
+    intersected_points = pd.DataFrame(points.drop(columns='geometry')).reset_index(drop=True)
+    intersected_points['crs28992_list'] = [lst.tolist() if len(lst) else np.nan for lst in crs_lists]
+    intersected_points['count_crs28992'] = counts
+
+    return intersected_points
+
 def finalize_intersections(intersected_points: pd.DataFrame, points: gpd.GeoDataFrame) -> pd.DataFrame:
     """
     Finalize intersected points:
@@ -118,8 +186,37 @@ def finalize_intersections(intersected_points: pd.DataFrame, points: gpd.GeoData
 
     return grouped_by_points
 
-def group_points_by_cbs_and_intervals(intersected_points: gpd.GeoDataFrame,
-                                      gdf_cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+def write_grouped_points_parquet(grouped_by_points: gpd.GeoDataFrame, path: str, compression: str = 'zstd') -> None:
+    """
+    Write grouped_by_points (finalize_intersections / process_realtime_with_cbs output) as GeoParquet:
+    - 'crs28992_list' as a native list<int64> column of cell codes (encode_cell_lists)
+    - text ID columns ('uni_id', 'route_id_left', 'trip_id', 'interval') as categoricals (dictionary encoded)
+    - geometry as WKB
+    Read it back with Optimization.load_grouped_points, which memory-maps the file.
+
+    Parameters:
+    - grouped_by_points : GeoDataFrame with 'crs28992_list' (lists or stringified lists)
+    - path : output .parquet path
+    - compression : Parquet compression codec (default 'zstd')
+    """
+    columnar = grouped_by_points.copy()
+    columnar['crs28992_list'] = encode_cell_lists(columnar['crs28992_list'])
+    for col in ['uni_id', 'route_id_left', 'trip_id', 'interval']:
+        if col in columnar and not pd.api.types.is_numeric_dtype(columnar[col]):
+            columnar[col] = columnar[col].astype('category')
+    columnar.to_parquet(path, index=False, compression=compression)
+
+def count_points_by_cbs_and_intervals(intersected_points: pd.DataFrame) -> pd.Series:
+    """
+    Count intersections per CBS cell and hourly interval.
+    Counts of separate chunks can be summed with Series.add(..., fill_value=0).
+
+    Parameters:
+    - intersected_points : DataFrame with 'crs28992_list' and 'new_timest'
+
+    Returns:
+    - Series of counts indexed by ('cell', 'interval'), cells as integer codes
+    """
     # Convert Unix timestamp → datetime
     intersected_points['timestamp'] = pd.to_datetime(intersected_points['new_timest'], unit='s')
     # Create hourly interval “H-H+1”
@@ -129,33 +226,44 @@ def group_points_by_cbs_and_intervals(intersected_points: gpd.GeoDataFrame,
         + ((intersected_points['timestamp'].dt.hour + 1) % 24).astype(str)
     )
 
-    # 1. Explode list → one row per CBS cell
+    # 1. Explode list → one row per CBS cell, as integer cell codes
     df = (
-        intersected_points
+        intersected_points[['crs28992_list', 'interval']]
         .dropna(subset=['crs28992_list'])
         .explode('crs28992_list')
-        .rename(columns={'crs28992_list': 'crs28992'})
     )
+    df['cell'] = encode_cell_ids(df['crs28992_list'])
+    df = df[df['cell'] >= 0]
 
     # 2. Count per cell & interval
-    counts = (
-        df
-        .groupby(['crs28992', 'interval'])
-        .size()
-        .reset_index(name='count')
-    )
+    return df.groupby(['cell', 'interval']).size()
 
+
+def merge_interval_counts_to_cbs(counts: pd.Series, gdf_cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Pivot (cell, interval) counts to one column per interval and merge them onto the CBS grid.
+
+    Parameters:
+    - counts  : Series from count_points_by_cbs_and_intervals (or a sum of them)
+    - gdf_cbs : CBS GeoDataFrame with 'crs28992' and 'geometry'
+
+    Returns:
+    - GeoDataFrame with 'crs28992', one column per interval, 'count' and 'geometry'
+    """
     # 3. Pivot wide, fill & sum
     pivot = (
         counts
-        .pivot(index='crs28992', columns='interval', values='count')
+        .reset_index(name='count')
+        .query('cell >= 0')
+        .pivot(index='cell', columns='interval', values='count')
         .fillna(0)
         .astype(int)
     )
     pivot['count'] = pivot.sum(axis=1)
 
     # 4. Merge back to CBS grid
-    result = gdf_cbs.merge(pivot, on='crs28992', how='left').fillna(0)
+    # the pivot holds no -1 codes, so CBS cells without a canonical id keep their row with zero counts
+    result = gdf_cbs.assign(cell=encode_cell_ids(gdf_cbs['crs28992'])).merge(pivot, on='cell', how='left').fillna(0)
 
     # 5. Reorder columns (5‑6 → 4‑5), then total & geometry
     hour_cols = [
@@ -167,12 +275,32 @@ def group_points_by_cbs_and_intervals(intersected_points: gpd.GeoDataFrame,
     return result[cols]
 
 
+def group_points_by_cbs_and_intervals(intersected_points: gpd.GeoDataFrame,
+                                      gdf_cbs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    counts = count_points_by_cbs_and_intervals(intersected_points)
+    return merge_interval_counts_to_cbs(counts, gdf_cbs)
+
+
 # FINAL FUNCTION 
 
+def join_points_with_cbs(points_prepared: gpd.GeoDataFrame, gdf_cbs: gpd.GeoDataFrame, buffer_size: float = 50,
+                         join_method: str = 'buffer') -> pd.DataFrame:
+    """
+    Intersections of prepared points with CBS cells, by buffer + sjoin or by grid stencil.
+    """
+    if join_method == 'buffer':
+        buffer = create_buffer(points_prepared, buffer_size)
+        return spatial_join_intersections(buffer, gdf_cbs)
+    if join_method == 'stencil':
+        return stencil_join_intersections(points_prepared, gdf_cbs, buffer_size)
+    raise ValueError(f"Unknown join_method '{join_method}', expected 'buffer' or 'stencil'")
+
+
 #old function problem with geometry and buffer - too many rows 
-def process_realtime_with_cbs(gdf_cbs: gpd.GeoDataFrame, points_realtime: gpd.GeoDataFrame, buffer_size: float = 50):
+def process_realtime_with_cbs(gdf_cbs: gpd.GeoDataFrame, points_realtime: gpd.GeoDataFrame, buffer_size: float = 50,
+                              join_method: str = 'buffer', chunk_size: int = None, parquet_path: str = None):
     """
-    Full in-memory pipeline to process realtime snapped points to CBS aggregation.
+    Full pipeline to process realtime snapped points to CBS aggregation.
 
     Steps:
     1. Prepare points and assign IDs.
@@ -181,63 +309,59 @@ def process_realtime_with_cbs(gdf_cbs: gpd.GeoDataFrame, points_realtime: gpd.Ge
     4. Finalize intersections (add geometry, intervals).
     5. Group by CBS cells and intervals.
 
+    With join_method='stencil', steps 2-3 are replaced by stencil_join_intersections,
+    which gives the same intersections without building buffer polygons.
+
+    With chunk_size set, steps 1-4 run on chunk_size points at a time and the per-cell/per-interval
+    counts are summed chunk by chunk, so buffers and join results never exist for the whole input at once.
+    The output is the same as the in-memory run.
+
     Parameters:
     - gdf_cbs : GeoDataFrame of CBS cells with 'crs28992' and 'geometry'
     - points_realtime : GeoDataFrame of snapped points
     - buffer_size : buffer distance in meters (default 50)
+    - join_method : 'buffer' (buffer + sjoin, default) or 'stencil' (grid arithmetic)
+    - chunk_size : number of points per chunk (default None = all points at once)
+    - parquet_path : optional path; grouped_by_points is also written there as GeoParquet
+                     (write_grouped_points_parquet)
 
     Returns:
     - grouped_by_points : DataFrame with intersected points, intervals, geometry
     - cbs_interval_counts : GeoDataFrame with counts per CBS cell and intervals
     """
-
-    points_prepared = prepare_points_for_join(gdf_cbs, points_realtime)
-    buffer = create_buffer(points_prepared, buffer_size)
-    intersected_points = spatial_join_intersections(buffer, gdf_cbs)
-    grouped_by_points = finalize_intersections(intersected_points, points_prepared)
-    cbs_interval_counts = group_points_by_cbs_and_intervals(intersected_points, gdf_cbs)
+    if join_method not in ('buffer', 'stencil'):
+        raise ValueError(f"Unknown join_method '{join_method}', expected 'buffer' or 'stencil'")
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive number of points")
+
+    # without points there is nothing to chunk; the in-memory run gives the empty outputs
+    if chunk_size is None or len(points_realtime) == 0:
+        points_prepared = prepare_points_for_join(gdf_cbs, points_realtime)
+        intersected_points = join_points_with_cbs(points_prepared, gdf_cbs, buffer_size, join_method)
+        grouped_by_points = finalize_intersections(intersected_points, points_prepared)
+        cbs_interval_counts = group_points_by_cbs_and_intervals(intersected_points, gdf_cbs)
+        if parquet_path:
+            write_grouped_points_parquet(grouped_by_points, parquet_path)
+        return grouped_by_points, cbs_interval_counts
+
+    grouped_chunks = []
+    counts = None
+    for start in range(0, len(points_realtime), chunk_size):
+        # IDs come from the original index, so they match the in-memory run
+        chunk = prepare_points_for_join(gdf_cbs, points_realtime.iloc[start:start + chunk_size].copy())
+        intersected_chunk = join_points_with_cbs(chunk, gdf_cbs, buffer_size, join_method)
+
+        grouped_chunk = finalize_intersections(intersected_chunk, chunk)
+        grouped_chunk.index = grouped_chunk.index + start
+        grouped_chunks.append(grouped_chunk)
+
+        chunk_counts = count_points_by_cbs_and_intervals(intersected_chunk)
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        del chunk, intersected_chunk
+
+    grouped_by_points = gpd.GeoDataFrame(pd.concat(grouped_chunks), geometry='geometry', crs="EPSG:28992")
+    cbs_interval_counts = merge_interval_counts_to_cbs(counts.astype(int), gdf_cbs)
+    if parquet_path:
+        write_grouped_points_parquet(grouped_by_points, parquet_path)
 
     return grouped_by_points, cbs_interval_counts
-
-
-
-# use only if the computer cannot calculate the whole buffer at once! 
-
-# def process_realtime_with_cbs(gdf_cbs: gpd.GeoDataFrame,
-#                              points_realtime: gpd.GeoDataFrame, buffered, 
-#                              buffer_size: float = 50):
-#     """
-#     Pipeline with chunked buffering of points_prepared (chunk size fixed at 300000).
-
-#     Steps:
-#     1. Prepare points.
-#     2. Buffer in chunks and concatenate.
-#     3. Spatial join intersections.
-#     4. Finalize intersections.
-#     5. Group by CBS cells and intervals.
-#     """
-#     # 1. Prepare points
-#     points_prepared = prepare_points_for_join(gdf_cbs, points_realtime)
-
-#     # 2. Buffer in fixed-size chunks
-    
-#     # chunks = np.array_split(points_prepared, 10)
-    
-#     # buffered_chunks = []
-#     # for df in chunks:
-#     #     df_chunk = df.copy()
-#     #     df_chunk["geometry"] = df_chunk.geometry.buffer(buffer_size)
-#     #     buffered_chunks.append(df_chunk)
-    
-#     # buffered = pd.concat(buffered_chunks, ignore_index=True)
-
-#     # 3. Spatial join intersections
-#     intersected = spatial_join_intersections(buffered, gdf_cbs)
-
-#     # 4. Finalize intersections
-#     grouped_by_points = finalize_intersections(intersected, points_prepared)
-
-#     # 5. Group by CBS cells and intervals
-#     # cbs_interval_counts = group_points_by_cbs_and_intervals(intersected, gdf_cbs)
-
-#     return grouped_by_points #cbs_interval_counts
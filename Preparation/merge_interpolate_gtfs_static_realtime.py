@@ -1,4 +1,5 @@
 
+import os
 import numpy as np
 from scipy.interpolate import interp1d
 import time
@@ -63,6 +64,89 @@ def filter_gtfs_realtime(gtfs_realtime_df: pd.DataFrame, start_timestamp: pd.Tim
     return unique_day,  points_per_day,  min_max_per_day,  filtered_df
 
 
+# explicit dtypes of the realtime columns the pipeline computes with (label and route_id may be missing)
+REALTIME_DTYPES = {
+    'timestamp': 'int64',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'label': 'float64',
+    'route_id': 'float64',
+}
+
+
+def realtime_route_ids(gtfs_zip_path: str, agency_id: str = "GVB", route_types=(0, 3)) -> np.ndarray:
+    """
+    route_ids (int64) of one agency's trams and buses in the static routes.txt, used to drop
+    other agencies' rows while reading the realtime data (enrich_and_filter_gtfs_data keeps the same rows).
+    """
+    with ZipFile(gtfs_zip_path) as myzip:
+        routes_df = pd.read_csv(myzip.open("routes.txt"), usecols=['route_id', 'agency_id', 'route_type'],
+                                dtype={'route_id': 'str', 'agency_id': 'str', 'route_type': 'Int64'})
+    keep = (routes_df['agency_id'] == agency_id) & routes_df['route_type'].isin(route_types)
+    return routes_df.loc[keep.fillna(False), 'route_id'].astype('int64').to_numpy()
+
+
+def read_gtfs_realtime_window(csv_path: str, start_timestamp: pd.Timestamp, end_timestamp: pd.Timestamp,
+                              route_ids=None, chunksize: int = 1_000_000, dtype: dict = None):
+    """
+    Streaming version of filter_gtfs_realtime for the week-long realtime CSV.
+
+    The file is read in chunks with explicit dtypes (REALTIME_DTYPES, plus `dtype` for other columns);
+    each chunk only adds its per-day counts and min/max timestamps to the running stats and keeps the rows
+    in [start_timestamp, end_timestamp) (and with a route_id in route_ids). Only that slice is materialized,
+    so peak memory follows one day instead of the week.
+
+    Parameters:
+    - csv_path        : realtime CSV (e.g. data/gtfs_realtime_data_12_to_19.csv), 'timestamp' in UNIX seconds
+    - start_timestamp : pd.Timestamp, e.g. '2024-03-15 05:30:00'
+    - end_timestamp   : pd.Timestamp, e.g. '2024-03-16 05:29:59'
+    - route_ids       : optional route_ids to keep (realtime_route_ids); None keeps all routes
+    - chunksize       : rows per chunk (default 1,000,000)
+    - dtype           : optional extra dtypes, e.g. {'trip_id': 'str'}
+
+    Returns:
+    - same as filter_gtfs_realtime: unique_day, points_per_day, min_max_per_day (over the whole file)
+      and the filtered DataFrame (original row labels, with 'timestamp_date', 'day' and 'day_of_week')
+    """
+    start, end = start_timestamp.value / 10 ** 9, end_timestamp.value / 10 ** 9
+    route_ids = None if route_ids is None else np.asarray(route_ids, dtype=float)
+
+    day_stats, parts = [], []
+    for chunk in pd.read_csv(csv_path, dtype={**REALTIME_DTYPES, **(dtype or {})}, chunksize=chunksize):
+        timestamps = chunk['timestamp']
+        day_stats.append(timestamps.groupby(timestamps.to_numpy() // 86400, sort=False).agg(['size', 'min', 'max']))
+
+        keep = (timestamps >= start) & (timestamps < end)
+        if route_ids is not None:
+            keep &= chunk['route_id'].isin(route_ids)
+        parts.append(chunk[keep])
+    if not parts:
+        raise ValueError(f"No rows in {csv_path}")
+
+    # per-day stats, days in order of first appearance (as filter_gtfs_realtime)
+    day_stats = pd.concat(day_stats).groupby(level=0, sort=False).agg({'size': 'sum', 'min': 'min', 'max': 'max'})
+    first = pd.to_datetime(day_stats['min'], unit='s')
+    last = pd.to_datetime(day_stats['max'], unit='s')
+    days = pd.Index(first.dt.date.to_numpy(), name='day')
+    print(first.min(), last.max())
+
+    unique_day = days.to_numpy()
+    points_per_day = pd.Series(day_stats['size'].to_numpy(), index=days, name='count').sort_values(ascending=False, kind='stable')
+    min_max_per_day = pd.DataFrame({'min': first.to_numpy(), 'max': last.to_numpy()}, index=days).sort_index()
+
+    filtered_df = pd.concat(parts)
+    filtered_df['timestamp_date'] = pd.to_datetime(filtered_df['timestamp'], unit='s')
+    filtered_df['day'] = filtered_df['timestamp_date'].dt.date
+    filtered_df['day_of_week'] = filtered_df['timestamp_date'].dt.day_name()
+
+    if len(filtered_df):
+        min_time = datetime.utcfromtimestamp(filtered_df['timestamp'].min()).strftime('%Y-%m-%d %H:%M:%S')
+        max_time = datetime.utcfromtimestamp(filtered_df['timestamp'].max()).strftime('%Y-%m-%d %H:%M:%S')
+        print(min_time, max_time)
+
+    return unique_day, points_per_day, min_max_per_day, filtered_df
+
+
 from zipfile import ZipFile
 import geopandas as gpd
 import pandas as pd
@@ -139,47 +223,46 @@ def enrich_and_filter_gtfs_data(filtered_realtime: pd.DataFrame, gtfs_zip_path:
     return gdf_gvb
 
 
-def apply_split_and_count_route_types(gdf_gvb: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+def apply_split_and_count_route_types(gdf_gvb: gpd.GeoDataFrame, distance_threshold: float = None) -> gpd.GeoDataFrame:
     """
     Splits each uni_id group based on large jumps in GPS coordinates and prints route_type counts.
 
+    A new segment starts wherever consecutive points of the same vehicle jump more than 0.01 degrees
+    in latitude or longitude, or, with distance_threshold set, more than that many metres in RD New (EPSG:28992).
+    Segments are numbered per vehicle: uni_id_2 = '<uni_id>_1', '<uni_id>_2', ...
+
     Parameters:
     - gdf_gvb : GeoDataFrame with 'uni_id', 'latitude', 'longitude', and 'route_type' columns
+    - distance_threshold : jump distance in metres (default None = 0.01 degree rule)
 
     Returns:
-    - Concatenated GeoDataFrame after group-wise splitting with new 'uni_id_2' assigned
+    - GeoDataFrame sorted by uni_id (original order within a vehicle) with new 'uni_id_2' assigned
     """
-
-    # Function to split the group and assign unique identifiers
-    def split_group(group_data):
-        # Calculate differences between consecutive latitudes and longitudes
-        lat_diff = group_data['latitude'].diff().dropna()  # Difference in latitudes
-        lon_diff = group_data['longitude'].diff().dropna()  # Difference in longitudes
-
-        # Identify points where lat difference > 0.01 or lon difference > 0.01
-        split_indices = (abs(lat_diff) > 0.01) | (abs(lon_diff) > 0.01)
-
-        # Initialize variables for split groups and identifiers
-        split_groups = []
-        identifier = 1
-        start_index = 0
-
-        # Iterate over the group and split it into smaller groups
-        for end_index, split_point in enumerate(split_indices):
-            if split_point:
-                split_groups.append(group_data.iloc[start_index:end_index + 1].copy())
-                split_groups[-1]['uni_id_2'] = f"{group_data['uni_id'].iloc[0]}_{identifier}"
-                start_index = end_index + 1
-                identifier += 1
-
-        # Add the remaining part of the group as a split group
-        split_groups.append(group_data.iloc[start_index:].copy())
-        split_groups[-1]['uni_id_2'] = f"{group_data['uni_id'].iloc[0]}_{identifier}"
-
-        return pd.concat(split_groups)
-
-    # Apply the split function to each group
-    gdf_gvb = gdf_gvb.groupby('uni_id').apply(split_group).reset_index(drop=True)
+    # Vehicles in sorted order, points in their original order
+    gdf_gvb = gdf_gvb[gdf_gvb['uni_id'].notna()]
+    gdf_gvb = gdf_gvb.iloc[np.argsort(gdf_gvb['uni_id'].to_numpy(dtype=str), kind='stable')].reset_index(drop=True)
+
+    uni_ids = gdf_gvb['uni_id'].to_numpy()
+    new_vehicle = np.ones(len(gdf_gvb), dtype=bool)
+    new_vehicle[1:] = uni_ids[1:] != uni_ids[:-1]
+
+    # Jumps between consecutive points
+    if distance_threshold is None:
+        lat_diff = np.abs(np.diff(gdf_gvb['latitude'].to_numpy(dtype=float), prepend=np.nan))
+        lon_diff = np.abs(np.diff(gdf_gvb['longitude'].to_numpy(dtype=float), prepend=np.nan))
+        jump = (lat_diff > 0.01) | (lon_diff > 0.01)
+    else:
+        rd_points = gpd.GeoSeries(gpd.points_from_xy(gdf_gvb['longitude'], gdf_gvb['latitude']), crs="EPSG:4326").to_crs("EPSG:28992")
+        step = np.hypot(np.diff(rd_points.x.to_numpy(), prepend=np.nan), np.diff(rd_points.y.to_numpy(), prepend=np.nan))
+        jump = step > distance_threshold
+
+    # Segment number per vehicle: 1 + jumps so far within the vehicle
+    jump &= ~new_vehicle
+    jumps_so_far = np.cumsum(jump)
+    vehicle_start = np.flatnonzero(new_vehicle)
+    segment = jumps_so_far - np.repeat(jumps_so_far[vehicle_start], np.diff(np.append(vehicle_start, len(gdf_gvb)))) + 1
+
+    gdf_gvb['uni_id_2'] = gdf_gvb['uni_id'].astype(str) + '_' + segment.astype(str)
 
     # Count occurrences of each route_type
     route_type_counts = gdf_gvb['route_type'].value_counts()
@@ -187,7 +270,83 @@ def apply_split_and_count_route_types(gdf_gvb: gpd.GeoDataFrame) -> gpd.GeoDataF
 
     return gdf_gvb
 
-def run_interpolation_on_traces(gdf_gvb: pd.DataFrame, interval: int = 5) -> gpd.GeoDataFrame:
+def interpolate_traces_batch(gdf_gvb: pd.DataFrame, interval: int = 5) -> pd.DataFrame:
+    """
+    Resample all vehicle segments (uni_id_2) at once on sorted arrays.
+
+    Same result as one interp1d(kind='linear', fill_value='extrapolate') per segment:
+    segments are laid out one after another, each new timestamp is located in its own segment
+    with a single searchsorted over offset timestamps, and metadata is broadcast from the first row.
+
+    Parameters:
+    - gdf_gvb : DataFrame with 'uni_id_2', 'timestamp', 'latitude', 'longitude', 'route_id', 'trip_id', 'route_type'
+    - interval: int, interpolation interval in seconds (default = 5)
+
+    Returns:
+    - DataFrame with 'new_timestamp', 'new_lat', 'new_lon', 'uni_id', 'route_id', 'trip_id', 'route_type'
+    """
+    # segment codes in groupby order, rows kept in their original order inside a segment
+    seg_codes, seg_names = pd.factorize(gdf_gvb['uni_id_2'], sort=True)
+    rows = np.flatnonzero(seg_codes >= 0)
+    rows = rows[np.argsort(seg_codes[rows], kind='stable')]
+    seg_sizes = np.bincount(seg_codes[rows], minlength=len(seg_names))
+
+    # single-point segments are skipped, as in the loop
+    keep = np.repeat(seg_sizes > 1, seg_sizes)
+    rows = rows[keep]
+    segments = np.flatnonzero(seg_sizes > 1)
+    sizes = seg_sizes[segments]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    timestamps = gdf_gvb['timestamp'].to_numpy()[rows]
+    first_rows = rows[starts]
+    t_first, t_last = timestamps[starts], timestamps[starts + sizes - 1]
+
+    # interp1d sorts each segment by time (stable); lexsort keeps segments contiguous
+    seg_of_row = np.repeat(np.arange(len(segments)), sizes)
+    order = np.lexsort((timestamps, seg_of_row))
+    rows, timestamps = rows[order], timestamps[order]
+    latitudes = gdf_gvb['latitude'].to_numpy(dtype=float)[rows]
+    longitudes = gdf_gvb['longitude'].to_numpy(dtype=float)[rows]
+
+    # new timestamps: np.arange(first, last, interval) per segment
+    n_new = np.maximum(np.ceil((t_last - t_first) / interval), 0).astype(np.int64)
+    seg_of_new = np.repeat(np.arange(len(segments)), n_new)
+    step = np.arange(n_new.sum()) - np.repeat(np.cumsum(n_new) - n_new, n_new)
+    new_timestamps = t_first[seg_of_new] + step * interval
+
+    # one searchsorted for all segments: shift every segment onto its own range of the time axis
+    t_min = timestamps[starts]
+    span = timestamps[starts + sizes - 1] - t_min
+    offsets = np.concatenate([[0], np.cumsum(span + 1)[:-1]])
+    shifted = (timestamps - np.repeat(t_min, sizes)) + np.repeat(offsets, sizes)
+    shifted_new = (new_timestamps - t_min[seg_of_new]) + offsets[seg_of_new]
+    local = np.searchsorted(shifted, shifted_new) - starts[seg_of_new]
+    hi = starts[seg_of_new] + np.clip(local, 1, sizes[seg_of_new] - 1)
+    lo = hi - 1
+
+    # linear interpolation / extrapolation between lo and hi, with interp1d's formula
+    x_lo, x_hi = timestamps[lo], timestamps[hi]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new_latitudes = (latitudes[hi] - latitudes[lo]) / (x_hi - x_lo) * (new_timestamps - x_lo) + latitudes[lo]
+        new_longitudes = (longitudes[hi] - longitudes[lo]) / (x_hi - x_lo) * (new_timestamps - x_lo) + longitudes[lo]
+
+    combined_df = pd.DataFrame({
+        'new_timestamp': new_timestamps,
+        'new_lat': new_latitudes,
+        'new_lon': new_longitudes
+    })
+
+    # Add metadata, broadcast from the first row of each segment
+    meta_rows = first_rows[seg_of_new]
+    combined_df['uni_id'] = np.asarray(seg_names)[segments][seg_of_new]
+    for col in ['route_id', 'trip_id', 'route_type']:
+        combined_df[col] = gdf_gvb[col].iloc[meta_rows].to_numpy()
+
+    return combined_df
+
+
+def run_interpolation_on_traces(gdf_gvb: pd.DataFrame, interval: int = 5, method: str = 'batch') -> gpd.GeoDataFrame:
     """
     Create a GeoDataFrame from interpolation results.
 
@@ -199,10 +358,35 @@ def run_interpolation_on_traces(gdf_gvb: pd.DataFrame, interval: int = 5) -> gpd
     Parameters:
     - gdf_gvb : DataFrame with real-time GTFS grouped by 'uni_id_2'
     - interval: int, interpolation interval in seconds (default = 5)
+    - method  : 'batch' (all segments in one vectorized pass, default) or 'loop' (interp1d per segment)
 
     Returns:
     - GeoDataFrame of all interpolated traces
     """
+    if method == 'batch':
+        combined_df = interpolate_traces_batch(gdf_gvb, interval)
+    elif method == 'loop':
+        combined_df = interpolate_traces_loop(gdf_gvb, interval)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'batch' or 'loop'")
+
+    """ Create a GeoDataFrame, set projection """
+    geometry = gpd.points_from_xy(combined_df['new_lon'], combined_df['new_lat'])
+    gdf = gpd.GeoDataFrame(combined_df, geometry=geometry)
+    gdf.set_crs(epsg=4326, inplace=True)
+
+    gdf = gdf.to_crs("EPSG:28992")  # Amersfoort / RD New projection
+
+    # Method: Split on 'GVB' and keep the first part + 'GVB'
+    gdf['uni_id'] = gdf['uni_id'].str.split('GVB').str[0] + 'GVB'
+
+    return gdf
+
+
+def interpolate_traces_loop(gdf_gvb: pd.DataFrame, interval: int = 5) -> pd.DataFrame:
+    """
+    Reference implementation of interpolate_traces_batch: one interp1d per segment (uni_id_2).
+    """
     interpolated_dfs = []
 
     for uni_id, group_df in gdf_gvb.groupby('uni_id_2'):
@@ -212,7 +396,6 @@ def run_interpolation_on_traces(gdf_gvb: pd.DataFrame, interval: int = 5) -> gpd
             longitudes = np.array(group_df['longitude'])
 
             # === Interpolation logic ===
-            from scipy.interpolate import interp1d
             interp_func_lat = interp1d(timestamps, latitudes, kind='linear', fill_value='extrapolate')
             interp_func_lon = interp1d(timestamps, longitudes, kind='linear', fill_value='extrapolate')
             new_timestamps_sec = np.arange(timestamps[0], timestamps[-1], interval)
@@ -234,29 +417,19 @@ def run_interpolation_on_traces(gdf_gvb: pd.DataFrame, interval: int = 5) -> gpd
             interpolated_dfs.append(interpolated_df)
 
     """ Create a single DataFrame """
-    combined_df = pd.concat(interpolated_dfs, ignore_index=True)
-
-    """ Create a GeoDataFrame, set projection """
-    geometry = gpd.points_from_xy(combined_df['new_lon'], combined_df['new_lat'])
-    gdf = gpd.GeoDataFrame(combined_df, geometry=geometry)
-    gdf.set_crs(epsg=4326, inplace=True)
-
-    gdf = gdf.to_crs("EPSG:28992")  # Amersfoort / RD New projection
-
-    # Method: Split on 'GVB' and keep the first part + 'GVB'
-    gdf['uni_id'] = gdf['uni_id'].str.split('GVB').str[0] + 'GVB'
-
-    return gdf
+    return pd.concat(interpolated_dfs, ignore_index=True)
 
 
 # FINAL FUNCTION 
 
 def process_gtfs_pipeline(gtfs_realtime_df: pd.DataFrame, gtfs_zip_path: str,
                                     start_timestamp: pd.Timestamp, end_timestamp: pd.Timestamp,
-                                    agency_id: str = "GVB") -> tuple[gpd.GeoDataFrame, pd.DataFrame, pd.Series, pd.DataFrame]:
+                                    agency_id: str = "GVB", split_distance: float = None,
+                                    chunksize: int = 1_000_000) -> tuple[gpd.GeoDataFrame, pd.DataFrame, pd.Series, pd.DataFrame]:
     """
-    Complete in-memory GTFS pipeline:
+    Complete GTFS pipeline:
     1. Filter GTFS real-time to one day and print stats
+       (a CSV path is streamed in chunks, keeping only the agency's tram/bus rows of that day)
     2. Merge real-time GTFS with static routes.txt
     3. Filter by agency and route_type
     4. Split on GPS jumps
@@ -264,11 +437,13 @@ def process_gtfs_pipeline(gtfs_realtime_df: pd.DataFrame, gtfs_zip_path: str,
 
 
     Parameters:
-    - gtfs_realtime_df : full GTFS real-time DataFrame
+    - gtfs_realtime_df : full GTFS real-time DataFrame, or the path of the realtime CSV (read_gtfs_realtime_window)
     - gtfs_zip_path    : static GTFS zip file path
     - start_timestamp  : e.g. pd.Timestamp('2024-03-15 05:30:00')
     - end_timestamp    : e.g. pd.Timestamp('2024-03-16 05:29:59')
     - agency_id        : GTFS agency_id to include (default 'GVB')
+    - split_distance   : GPS jump in metres that starts a new segment (default None = 0.01 degree rule)
+    - chunksize        : rows per chunk when gtfs_realtime_df is a path (default 1,000,000)
 
     Returns:
     - final_gdf        : GeoDataFrame in EPSG:28992
@@ -277,15 +452,21 @@ def process_gtfs_pipeline(gtfs_realtime_df: pd.DataFrame, gtfs_zip_path: str,
     - min_max_per_day  : pd.DataFrame with min/max per date
     """
     # 1. Filter real-time GTFS and print date info
-    unique_day, points_per_day, min_max_per_day, filtered_realtime = filter_gtfs_realtime(
-        gtfs_realtime_df, start_timestamp, end_timestamp
-    )
+    if isinstance(gtfs_realtime_df, (str, os.PathLike)):
+        unique_day, points_per_day, min_max_per_day, filtered_realtime = read_gtfs_realtime_window(
+            gtfs_realtime_df, start_timestamp, end_timestamp,
+            route_ids=realtime_route_ids(gtfs_zip_path, agency_id), chunksize=chunksize
+        )
+    else:
+        unique_day, points_per_day, min_max_per_day, filtered_realtime = filter_gtfs_realtime(
+            gtfs_realtime_df, start_timestamp, end_timestamp
+        )
 
     # 2. Merge with static and filter agency/route_type
     gdf_gvb = enrich_and_filter_gtfs_data(filtered_realtime, gtfs_zip_path, agency_id_filter=agency_id)
 
     # 3. Split traces by GPS jumps
-    gdf_gvb = apply_split_and_count_route_types(gdf_gvb)
+    gdf_gvb = apply_split_and_count_route_types(gdf_gvb, distance_threshold=split_distance)
 
     # 4. Interpolate traces
     interpolated_df = run_interpolation_on_traces(gdf_gvb)
@@ -1,14 +1,36 @@
 # import libraries
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import geopandas as gpd
+import shapely
+from concurrent.futures import ThreadPoolExecutor
 
-# FINAL FUNCTION 
 
-def snap_interpolated_points_to_routes(routes_gdf: gpd.GeoDataFrame, interpolated_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+def snap_points(points_gdf: gpd.GeoDataFrame, lines_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
-    Snap interpolated GTFS points (buses and trams) to their nearest GVB route lines in Amsterdam.
+    Snap points onto their nearest line.
+
+    The nearest line comes from sjoin_nearest; projection onto it and interpolation back to a point
+    run as shapely array operations over all points at once (same result as road.interpolate(road.project(point))).
+
+    Parameters:
+    - points_gdf : GeoDataFrame of points
+    - lines_gdf  : GeoDataFrame of lines in the same CRS
+
+    Returns:
+    - GeoDataFrame of points joined with their nearest line's attributes, geometry snapped onto that line
+    """
+    joined = gpd.sjoin_nearest(points_gdf, lines_gdf, how="inner", distance_col="dist")
+    roads = lines_gdf.geometry.loc[joined['index_right'].to_numpy()].values
+    points = joined.geometry.values
+    snapped = shapely.line_interpolate_point(roads, shapely.line_locate_point(roads, points))
+    joined['geometry'] = gpd.GeoSeries(snapped, index=joined.index, crs=joined.crs)
+    return joined.drop(columns=['index_right', 'dist'])
+
+
+def snap_points_by_mode(routes_gdf: gpd.GeoDataFrame, interpolated_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Compute-only snapping: trams onto tram lines, buses onto bus lines. Never plots.
 
     Parameters:
     - routes_gdf         : GeoDataFrame of public transport routes (must include 'route_type')
@@ -17,7 +39,6 @@ def snap_interpolated_points_to_routes(routes_gdf: gpd.GeoDataFrame, interpolate
     Returns:
     - GeoDataFrame of snapped GTFS points (deduplicated), projected in same CRS as routes_gdf
     """
-
     # Reproject interpolated data to match routes CRS
     interpolated_gdf = interpolated_gdf.to_crs(routes_gdf.crs)
 
@@ -28,25 +49,6 @@ def snap_interpolated_points_to_routes(routes_gdf: gpd.GeoDataFrame, interpolate
     routes_trams = routes_gdf[routes_gdf['route_type'] == 0]
     routes_buses = routes_gdf[routes_gdf['route_type'] == 3]
 
-    # Plot raw data
-    fig, ax = plt.subplots(figsize=(10, 10))
-    routes_gdf.plot(ax=ax, color='black', linewidth=0.5)
-    interpolated_gdf.plot(ax=ax, color='red', linewidth=0.5, markersize=0.2)
-    plt.title('Routes and Interpolated GTFS Points')
-
-    def snap_points(points_gdf, lines_gdf):
-        joined = gpd.sjoin_nearest(points_gdf, lines_gdf, how="inner", distance_col="dist")
-        snapped = []
-        for i, row in joined.iterrows():
-            if (i + 1) % 1000 == 0:
-                print(f"Processed {i + 1} values")
-            road = lines_gdf.loc[int(row['index_right'])].geometry
-            proj = road.project(row.geometry)
-            snapped_point = road.interpolate(proj)
-            snapped.append(snapped_point)
-        joined['geometry'] = snapped
-        return joined.drop(columns=['index_right', 'dist'])
-
     # Snap trams
     final_trams = snap_points(interpolated_trams, routes_trams)
     final_trams = final_trams[['new_timestamp', 'new_lat', 'new_lon', 'uni_id', 'route_id_left', 'trip_id', 'route_type_left', 'geometry']]
@@ -61,10 +63,141 @@ def snap_interpolated_points_to_routes(routes_gdf: gpd.GeoDataFrame, interpolate
     # Drop duplicates
     snapped = snapped.drop_duplicates(subset=['new_lat', 'new_lon', 'new_timestamp', 'uni_id'], keep='first')
 
+    return snapped
+
+
+def snap_points_by_route(routes_gdf: gpd.GeoDataFrame, interpolated_gdf: gpd.GeoDataFrame,
+                         n_jobs: int = 1) -> gpd.GeoDataFrame:
+    """
+    Compute-only snapping constrained to each point's own route.
+
+    Points and lines are partitioned by route_id (compared as strings, realtime ids are ints and
+    static ids are strings) within each mode, and every partition is snapped against its own route
+    geometry only. Points whose route has no line fall back to the nearest line of their mode,
+    as in snap_points_by_mode. Partitions are independent, so they can run on n_jobs threads
+    (shapely releases the GIL for the spatial work).
+
+    Parameters:
+    - routes_gdf         : GeoDataFrame of public transport routes (must include 'route_id', 'route_type')
+    - interpolated_gdf   : GeoDataFrame of interpolated GTFS points (must include 'route_id', 'route_type', 'geometry')
+    - n_jobs             : number of threads (default 1)
+
+    Returns:
+    - GeoDataFrame of snapped GTFS points (deduplicated), same columns and row order as snap_points_by_mode
+    """
+    # Reproject interpolated data to match routes CRS
+    interpolated_gdf = interpolated_gdf.to_crs(routes_gdf.crs)
+    interpolated_gdf = interpolated_gdf.assign(point_order=np.arange(len(interpolated_gdf)))
+
+    point_routes = interpolated_gdf['route_id'].astype(str).to_numpy()
+    line_routes = routes_gdf['route_id'].astype(str).to_numpy()
+
+    # One task per (mode, route), plus one mode-wide task for points without their own line
+    tasks = []
+    for mode_order, mode in enumerate([3, 0]):  # buses first, as snap_points_by_mode
+        point_mode = (interpolated_gdf['route_type'] == mode).to_numpy()
+        line_mode = (routes_gdf['route_type'] == mode).to_numpy()
+
+        own_line = point_mode & np.isin(point_routes, line_routes[line_mode])
+        own_pos = np.flatnonzero(own_line)
+        for route, pos in pd.Series(own_pos).groupby(point_routes[own_pos]):
+            tasks.append((mode_order, interpolated_gdf.iloc[pos.to_numpy()], routes_gdf[line_mode & (line_routes == route)]))
+
+        fallback = point_mode & ~own_line
+        if fallback.any():
+            tasks.append((mode_order, interpolated_gdf[fallback], routes_gdf[line_mode]))
+
+    # No tram or bus points: nothing to snap
+    if not tasks:
+        return gpd.GeoDataFrame(columns=['new_timestamp', 'new_lat', 'new_lon', 'uni_id', 'route_id_left', 'trip_id', 'route_type_left', 'geometry'],
+                                geometry='geometry', crs=routes_gdf.crs)
+
+    def snap_task(task):
+        mode_order, points, lines = task
+        return snap_points(points, lines).assign(mode_order=mode_order)
+
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            snapped_parts = list(executor.map(snap_task, tasks))
+    else:
+        snapped_parts = [snap_task(task) for task in tasks]
+
+    # Combine in the order of snap_points_by_mode: buses, trams, original point order within a mode
+    snapped = pd.concat(snapped_parts).sort_values(['mode_order', 'point_order'], kind='stable')
+    snapped = snapped[['new_timestamp', 'new_lat', 'new_lon', 'uni_id', 'route_id_left', 'trip_id', 'route_type_left', 'geometry']]
+    snapped = gpd.GeoDataFrame(snapped.reset_index(drop=True), crs=routes_gdf.crs)
+
+    # Drop duplicates
+    snapped = snapped.drop_duplicates(subset=['new_lat', 'new_lon', 'new_timestamp', 'uni_id'], keep='first')
+
+    return snapped
+
+
+def plot_snapping_diagnostics(routes_gdf: gpd.GeoDataFrame, interpolated_gdf: gpd.GeoDataFrame,
+                              snapped_gdf: gpd.GeoDataFrame, sample_size: int = None, seed: int = 0):
+    """
+    Diagnostic maps of the routes with the raw and the snapped points.
+
+    Parameters:
+    - routes_gdf       : GeoDataFrame of public transport routes
+    - interpolated_gdf : GeoDataFrame of interpolated GTFS points (before snapping)
+    - snapped_gdf      : output of snap_points_by_mode
+    - sample_size      : number of points drawn per map (default None = all points)
+    - seed             : random seed for the sample
+
+    Returns:
+    - raw_fig, snapped_fig : matplotlib figures
+    """
+    # imported here so the snapping itself never loads matplotlib
+    import matplotlib.pyplot as plt
+
+    interpolated_gdf = interpolated_gdf.to_crs(routes_gdf.crs)
+    if sample_size is not None:
+        interpolated_gdf = interpolated_gdf.sample(n=min(sample_size, len(interpolated_gdf)), random_state=seed)
+        snapped_gdf = snapped_gdf.sample(n=min(sample_size, len(snapped_gdf)), random_state=seed)
+
+    # Plot raw data
+    raw_fig, ax = plt.subplots(figsize=(10, 10))
+    routes_gdf.plot(ax=ax, color='black', linewidth=0.5)
+    interpolated_gdf.plot(ax=ax, color='red', linewidth=0.5, markersize=0.2)
+    ax.set_title('Routes and Interpolated GTFS Points')
+
     # Plot snapped
-    fig, ax = plt.subplots(figsize=(10, 10))
+    snapped_fig, ax = plt.subplots(figsize=(10, 10))
     routes_gdf.plot(ax=ax, color='black', linewidth=0.5)
-    snapped.plot(ax=ax, color='red', linewidth=0.5, markersize=0.2)
-    plt.title('Roads and Snapped GTFS Points')
+    snapped_gdf.plot(ax=ax, color='red', linewidth=0.5, markersize=0.2)
+    ax.set_title('Roads and Snapped GTFS Points')
+
+    return raw_fig, snapped_fig
+
+
+# FINAL FUNCTION 
+
+def snap_interpolated_points_to_routes(routes_gdf: gpd.GeoDataFrame, interpolated_gdf: gpd.GeoDataFrame,
+                                       plot: bool = True, plot_sample_size: int = None,
+                                       match: str = 'mode', n_jobs: int = 1) -> gpd.GeoDataFrame:
+    """
+    Snap interpolated GTFS points (buses and trams) to their nearest GVB route lines in Amsterdam.
+
+    Parameters:
+    - routes_gdf         : GeoDataFrame of public transport routes (must include 'route_type')
+    - interpolated_gdf   : GeoDataFrame of interpolated GTFS points (must include 'route_type', 'geometry')
+    - plot               : draw the diagnostic maps (default True); False for headless batch runs
+    - plot_sample_size   : number of points drawn per map (default None = all points)
+    - match              : 'mode' (nearest line of the same mode, default) or 'route' (own route_id line only)
+    - n_jobs             : number of threads for match='route' (default 1)
+
+    Returns:
+    - GeoDataFrame of snapped GTFS points (deduplicated), projected in same CRS as routes_gdf
+    """
+    if match == 'mode':
+        snapped = snap_points_by_mode(routes_gdf, interpolated_gdf)
+    elif match == 'route':
+        snapped = snap_points_by_route(routes_gdf, interpolated_gdf, n_jobs=n_jobs)
+    else:
+        raise ValueError(f"Unknown match '{match}', expected 'mode' or 'route'")
+
+    if plot:
+        plot_snapping_diagnostics(routes_gdf, interpolated_gdf, snapped, sample_size=plot_sample_size)
 
-    return snapped
\ No newline at end of file
+    return snapped
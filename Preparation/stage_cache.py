@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import inspect
+import sys
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+DEFAULT_CACHE_DIR = os.path.join('data', 'temp', 'stage_cache')
+MANIFEST = 'manifest.json'
+
+
+def column_digest(values: pd.Series) -> bytes:
+    """
+    Bytes that identify the content of one column: hash_pandas_object for numeric, boolean,
+    datetime and categorical columns, raw WKB for geometries, and the joined reprs for text
+    and object columns (lists, mixed types), which is much faster than hashing strings one by one.
+    """
+    if isinstance(values.dtype, gpd.array.GeometryDtype):
+        wkb = shapely.to_wkb(values.to_numpy())
+        return np.fromiter(map(len, wkb), dtype=np.int64, count=len(wkb)).tobytes() + b''.join(wkb)
+    if (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)
+            or pd.api.types.is_datetime64_any_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype)):
+        return pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()
+    items = [v.tolist() if isinstance(v, np.ndarray) else v for v in values.to_numpy(dtype=object)]
+    return '\x1f'.join(map(repr, items)).encode('utf-8', 'surrogatepass')
+
+
+def fingerprint(obj) -> str:
+    """
+    Content fingerprint (sha256 hex) of a stage input.
+
+    - DataFrame / GeoDataFrame / Series : column_digest of every column, plus index, column names,
+      dtypes and CRS
+    - path of an existing file           : path, size and modification time (the file is not read)
+    - list / tuple / dict                : fingerprints of the items
+    - numpy array                        : dtype, shape and raw bytes (column_digest for object arrays)
+    - anything else (Timestamp, numbers, strings, None) : its repr
+    """
+    h = hashlib.sha256()
+
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame(name=repr(obj.name))
+
+    if isinstance(obj, pd.DataFrame):
+        h.update(type(obj).__name__.encode())
+        h.update(repr(list(obj.columns)).encode())
+        h.update(repr([str(dtype) for dtype in obj.dtypes]).encode())
+        if isinstance(obj, gpd.GeoDataFrame) and obj.crs is not None:
+            h.update(obj.crs.to_string().encode())
+        h.update(column_digest(obj.index.to_series()))
+        for col in range(obj.shape[1]):
+            h.update(column_digest(obj.iloc[:, col]))
+
+    elif isinstance(obj, (str, os.PathLike)) and os.path.isfile(obj):
+        stat = os.stat(obj)
+        h.update(f"file:{os.path.abspath(obj)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    elif isinstance(obj, (list, tuple)):
+        h.update(type(obj).__name__.encode())
+        for item in obj:
+            h.update(fingerprint(item).encode())
+
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=repr):
+            h.update(repr(key).encode())
+            h.update(fingerprint(obj[key]).encode())
+
+    elif isinstance(obj, np.ndarray):
+        h.update(str(obj.dtype).encode() + repr(obj.shape).encode())
+        # object arrays hold pointers, so their content goes through the same path as object columns
+        h.update(column_digest(pd.Series(obj.ravel())) if obj.dtype == object else np.ascontiguousarray(obj).tobytes())
+
+    else:
+        h.update(repr(obj).encode())
+
+    return h.hexdigest()
+
+
+def input_copy(value):
+    """
+    Copy of a DataFrame / GeoDataFrame / Series stage argument (other arguments are passed as they are),
+    so stages that modify their inputs in place leave the caller's data, and with it the next key, unchanged.
+    """
+    return value.copy() if isinstance(value, (pd.DataFrame, pd.Series)) else value
+
+
+def code_digest(func) -> str:
+    """
+    sha256 of the source code behind a stage: every .py file of the package that defines it
+    (e.g. all of Preparation/ for process_gtfs_pipeline), so editing a helper the stage calls,
+    in the same or a sibling module, changes the digest. A stage outside a package uses its
+    module file, and one without a source file (builtins, notebook cells) its own source if available.
+    """
+    h = hashlib.sha256()
+    module = sys.modules.get(func.__module__)
+    module_file = getattr(module, '__file__', None)
+    if module_file and os.path.exists(module_file):
+        directory = os.path.dirname(os.path.abspath(module_file))
+        files = ([os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.py')]
+                 if getattr(module, '__package__', None) else [module_file])
+        for path in files:
+            h.update(os.path.basename(path).encode())
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    else:
+        try:
+            h.update(inspect.getsource(func).encode())
+        except (OSError, TypeError):
+            pass
+    return h.hexdigest()
+
+
+def stage_key(func, args=(), kwargs=None) -> str:
+    """
+    Cache key of one stage call: the stage's name, the source of its package (code_digest), and the
+    fingerprints of all arguments (keyword arguments by name). Editing any module of the stage's package
+    invalidates its entries; changes outside it (installed libraries, data read inside the stage
+    from paths that are not arguments) are not seen, call StageCache.clear() after those.
+    """
+    h = hashlib.sha256(f"{func.__module__}.{func.__qualname__}".encode())
+    h.update(code_digest(func).encode())
+    h.update(fingerprint(list(args)).encode())
+    h.update(fingerprint(dict(kwargs or {})).encode())
+    return h.hexdigest()
+
+
+def write_part(obj, path_stem):
+    """
+    Stores one output object: (Geo)DataFrames and Series as Parquet, anything Parquet cannot
+    hold (mixed object columns, non-string column names, other types) as pickle.
+    Returns the part description for the manifest.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        kind = 'series' if isinstance(obj, pd.Series) else ('geodataframe' if isinstance(obj, gpd.GeoDataFrame) else 'dataframe')
+        frame = obj.to_frame(name='__value__') if kind == 'series' else obj
+        try:
+            frame.to_parquet(path_stem + '.parquet')
+            part = {'file': os.path.basename(path_stem) + '.parquet', 'kind': kind}
+            if kind == 'series':
+                json.dumps(obj.name)  # the name goes into the manifest
+                part['name'] = obj.name
+            return part
+        except Exception:
+            if os.path.exists(path_stem + '.parquet'):
+                os.remove(path_stem + '.parquet')
+
+    with open(path_stem + '.pkl', 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {'file': os.path.basename(path_stem) + '.pkl', 'kind': 'pickle'}
+
+
+def read_part(part, entry_dir):
+    """Loads one stored output object (see write_part)."""
+    path = os.path.join(entry_dir, part['file'])
+    if part['kind'] == 'pickle':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    if part['kind'] == 'geodataframe':
+        return gpd.read_parquet(path)
+    frame = pd.read_parquet(path)
+    if part['kind'] == 'series':
+        return frame['__value__'].rename(part.get('name'))
+    return frame
+
+
+class StageCache:
+    """
+    Content-addressed cache for Preparation stages.
+
+    Every stage call is keyed by stage_key (stage name + source of its package, fingerprints of the input
+    data and parameters) and its outputs are stored under cache_dir/<key>/ (Parquet, pickle fallback) with a
+    manifest. Unchanged upstream stages are loaded instead of recomputed, e.g. changing only
+    buffer_size of process_realtime_with_cbs reuses the cached GTFS merge, interpolation and snapping:
+
+        cache = StageCache()
+        gvb_points, ... = cache.run(process_gtfs_pipeline, realtime_df, zip_path, start, end, agency_id='GVB')
+        snapped = cache.run(snap_interpolated_points_to_routes, routes, interpolated, plot=False)
+        grouped, counts = cache.run(process_realtime_with_cbs, cbs, snapped, buffer_size=75)
+
+    Entries are evicted least recently used first when the cache exceeds max_bytes or max_entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=10 * 1024 ** 3, max_entries=None, verbose=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.verbose = verbose
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def run(self, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), from the cache if the same stage ran on the same inputs before.
+        The stage runs on copies of the DataFrame arguments (input_copy): several stages modify their inputs
+        in place (filter_gtfs_realtime adds date columns, process_realtime_with_cbs renames new_timestamp),
+        which would otherwise change the caller's data and miss on the next identical call.
+        """
+        key = stage_key(func, args, kwargs)
+        cached = self.load(key)
+        if cached is not None:
+            if self.verbose:
+                print(f"[stage cache] {func.__name__}: hit {key[:12]}")
+            return cached[0]
+
+        start_time = time.time()
+        result = func(*[input_copy(arg) for arg in args], **{name: input_copy(arg) for name, arg in kwargs.items()})
+        self.store(key, result, stage=func.__name__, seconds=time.time() - start_time)
+        if self.verbose:
+            print(f"[stage cache] {func.__name__}: stored {key[:12]} ({time.time() - start_time:.1f} s)")
+        return result
+
+    def load(self, key):
+        """(result,) for a cached key, None if it is not cached; marks the entry as recently used."""
+        entry_dir = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry_dir, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        parts = [read_part(part, entry_dir) for part in manifest['parts']]
+        result = parts[0] if manifest['structure'] == 'single' else tuple(parts)
+
+        manifest['last_used'] = time.time()
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        return (result,)
+
+    def store(self, key, result, stage='', seconds=None):
+        """Stores a stage result (one object or a tuple of objects) under key, then evicts."""
+        entry_dir = os.path.join(self.cache_dir, key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(entry_dir)
+
+        single = not isinstance(result, tuple)
+        parts = [write_part(obj, os.path.join(entry_dir, f"part_{i}"))
+                 for i, obj in enumerate([result] if single else result)]
+        size = sum(os.path.getsize(os.path.join(entry_dir, part['file'])) for part in parts)
+
+        manifest = {
+            'stage': stage, 'structure': 'single' if single else 'tuple', 'parts': parts,
+            'bytes': size, 'seconds': seconds, 'created': time.time(), 'last_used': time.time(),
+        }
+        # the manifest is written last: an entry without one is incomplete and ignored
+        with open(os.path.join(entry_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        self.evict(keep=key)
+
+    def entries(self):
+        """DataFrame of the complete cache entries (key, stage, bytes, seconds, created, last_used)."""
+        rows = []
+        for key in os.listdir(self.cache_dir):
+            manifest_path = os.path.join(self.cache_dir, key, MANIFEST)
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                rows.append({'key': key, **{k: manifest[k] for k in ('stage', 'bytes', 'seconds', 'created', 'last_used')}})
+        columns = ['key', 'stage', 'bytes', 'seconds', 'created', 'last_used']
+        return pd.DataFrame(rows, columns=columns).sort_values('last_used', ascending=False, ignore_index=True)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the size and count limits hold (never `keep`)."""
+        entries = self.entries()
+        total = entries['bytes'].sum()
+        for i in range(len(entries) - 1, -1, -1):
+            over_size = self.max_bytes is not None and total > self.max_bytes
+            over_count = self.max_entries is not None and i >= self.max_entries
+            if not (over_size or over_count):
+                break
+            if entries.at[i, 'key'] == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, entries.at[i, 'key']), ignore_errors=True)
+            total -= entries.at[i, 'bytes']
+
+    def clear(self):
+        """Removes all entries."""
+        for key in os.listdir(self.cache_dir):
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
@@ -0,0 +1,28 @@
+import numpy as np
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from Preparation.intersection_points_cbs_frequency import process_realtime_with_cbs
+
+
+@pytest.mark.parametrize('join_method', ['buffer', 'stencil'])
+@pytest.mark.parametrize('chunk_size', [None, 100])
+def test_empty_points_give_empty_outputs(join_method, chunk_size):
+    cells = [(e, n) for e in range(1200, 1205) for n in range(4850, 4855)]
+    cbs = gpd.GeoDataFrame({
+        'crs28992': [f"E{e:04d}N{n:04d}" for e, n in cells],
+        'geometry': [box(e * 100, n * 100, e * 100 + 100, n * 100 + 100) for e, n in cells],
+    }, crs='EPSG:28992')
+    points = gpd.GeoDataFrame({
+        'new_timestamp': np.array([], dtype=np.int64), 'uni_id': np.array([], dtype=object),
+        'route_id_left': np.array([], dtype=np.int64), 'trip_id': np.array([], dtype=object),
+        'route_type_left': np.array([], dtype=np.int64),
+    }, geometry=gpd.points_from_xy([], []), crs='EPSG:28992')
+
+    grouped, counts = process_realtime_with_cbs(cbs, points, buffer_size=50, join_method=join_method,
+                                                chunk_size=chunk_size)
+
+    assert len(grouped) == 0
+    assert len(counts) == len(cbs)
+    assert (counts['count'] == 0).all()
@@ -0,0 +1,86 @@
+import datetime
+import zipfile
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+from Preparation.stage_cache import StageCache, fingerprint
+from Preparation.intersection_points_cbs_frequency import process_realtime_with_cbs
+from Preparation.merge_interpolate_gtfs_static_realtime import process_gtfs_pipeline
+
+
+def small_cbs():
+    cells = [(e, n) for e in range(1200, 1210) for n in range(4850, 4860)]
+    return gpd.GeoDataFrame({
+        'crs28992': [f"E{e:04d}N{n:04d}" for e, n in cells],
+        'A_inhab': np.arange(len(cells)) + 5,
+        'geometry': [box(e * 100, n * 100, e * 100 + 100, n * 100 + 100) for e, n in cells],
+    }, crs='EPSG:28992')
+
+
+def small_points():
+    rng = np.random.default_rng(0)
+    n = 200
+    return gpd.GeoDataFrame({
+        'new_timestamp': 1710480600 + np.arange(n) * 60,
+        'uni_id': np.where(np.arange(n) % 2, '101_GVB', '102_GVB'),
+        'route_id_left': 5, 'trip_id': 't1', 'route_type_left': 3, 'new_lat': 0.0, 'new_lon': 0.0,
+    }, geometry=gpd.points_from_xy(rng.uniform(120000, 121000, n), rng.uniform(485000, 486000, n)), crs='EPSG:28992')
+
+
+def small_gtfs(tmp_path):
+    routes = pd.DataFrame({'route_id': ['1', '2'], 'agency_id': 'GVB', 'route_short_name': ['1', '2'],
+                           'route_long_name': 'x', 'route_desc': '', 'route_type': [3, 0]})
+    zip_path = tmp_path / 'gtfs.zip'
+    with zipfile.ZipFile(zip_path, 'w') as z:
+        z.writestr('routes.txt', routes.to_csv(index=False))
+
+    t0 = int(pd.Timestamp('2024-03-15 06:00:00').value // 10 ** 9)
+    realtime = pd.concat([
+        pd.DataFrame({'timestamp': t0 + np.arange(100) * 30, 'latitude': 52.37 + np.arange(100) * 1e-4,
+                      'longitude': 4.90 + np.arange(100) * 1e-4, 'label': 1000 + v, 'route_id': v + 1,
+                      'trip_id': 500 + v, 'start_date': 20240315, 'vehicle_id': f'v{v}'})
+        for v in range(2)
+    ], ignore_index=True)
+    return realtime, str(zip_path)
+
+
+def test_second_call_on_same_points_is_a_hit(tmp_path, capsys):
+    cache = StageCache(str(tmp_path / 'cache'))
+    cbs, points = small_cbs(), small_points()
+    before = fingerprint(points)
+
+    first = cache.run(process_realtime_with_cbs, cbs, points, buffer_size=50)
+    second = cache.run(process_realtime_with_cbs, cbs, points, buffer_size=50)
+
+    assert fingerprint(points) == before
+    assert 'new_timestamp' in points.columns
+    assert capsys.readouterr().out.count(': hit ') == 1
+    assert len(cache.entries()) == 1
+    pd.testing.assert_frame_equal(pd.DataFrame(first[1]).drop(columns='geometry'),
+                                  pd.DataFrame(second[1]).drop(columns='geometry'), check_dtype=False)
+
+
+def test_second_call_on_same_realtime_is_a_hit(tmp_path, capsys):
+    cache = StageCache(str(tmp_path / 'cache'))
+    realtime, zip_path = small_gtfs(tmp_path)
+    columns = list(realtime.columns)
+    start, end = pd.Timestamp('2024-03-15 05:30:00'), pd.Timestamp('2024-03-16 05:29:59')
+
+    cache.run(process_gtfs_pipeline, realtime, zip_path, start, end)
+    capsys.readouterr()
+    cache.run(process_gtfs_pipeline, realtime, zip_path, start, end)
+
+    assert list(realtime.columns) == columns
+    assert ': hit ' in capsys.readouterr().out
+    assert len(cache.entries()) == 1
+
+
+def test_object_arrays_are_fingerprinted_by_content():
+    a = np.array([''.join(['ab', 'ccc'])], dtype=object)
+    b = np.array([''.join(['abc', 'cc'])], dtype=object)
+    assert fingerprint(a) == fingerprint(b)
+    assert fingerprint(np.array([datetime.date(2024, 3, 15)], dtype=object)) == \
+        fingerprint(np.array([datetime.date(2024, 3, 15)], dtype=object))
+    assert fingerprint(a) != fingerprint(np.array(['abcc'], dtype=object))